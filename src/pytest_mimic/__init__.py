@@ -12,7 +12,8 @@ Example:
         assert result == expected_value
 """
 
+from .lazy import resolve_lazy
 from .mimic_manager import mimic
 
-__all__ = ["mimic"]
+__all__ = ["mimic", "resolve_lazy"]
 __version__ = "0.1.0"
@@ -0,0 +1,444 @@
+import dataclasses
+import datetime
+import decimal
+import hashlib
+import io
+import itertools
+import operator
+import pickle
+import uuid
+import weakref
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+from .lazy import LazyResult, resolve_lazy
+
+# Protocol of the encoding, pinned so that hashes don't change with the default
+# protocol of the Python version
+PICKLE_PROTOCOL = 4
+
+# Version of the encoding, to bump whenever the encoding of a value changes, as it changes
+# the hash keys of the recordings:
+# 1. Plain pickle
+# 2. Canonical encoding: dicts and sets in a canonical order, sequences of dicts as columns
+# 3. Large immutable builtins and objects opting in encoded by their digest
+KEY_ENCODING_VERSION = 3
+
+# Whether large immutable builtins and objects opting in are encoded by their digest, which
+# is disabled to encode the arguments like version 2 of the encoding
+_use_digests: ContextVar[bool] = ContextVar("mimic_use_digests", default=True)
+
+# Types whose pickled representation only depends on their value
+_ATOMIC_TYPES = frozenset(
+    {
+        type(None),
+        bool,
+        int,
+        float,
+        complex,
+        str,
+        bytes,
+        decimal.Decimal,
+        uuid.UUID,
+        datetime.date,
+        datetime.time,
+        datetime.datetime,
+        datetime.timedelta,
+    }
+)
+
+_ATOMIC_TYPES_EXCEPT_BYTES = _ATOMIC_TYPES - {bytes}
+
+# Types that can be ordered without encoding them first
+_SORTABLE_TYPES = frozenset({str, int, float, bytes})
+
+_CONTAINER_TYPES = frozenset({list, tuple, dict, set, frozenset})
+
+# Sizes from which immutable bytes, tuples and frozensets are encoded by their digest,
+# which is memoized so that passing the same object again doesn't encode it again.
+# Changing them changes the hash keys: bump KEY_ENCODING_VERSION
+DIGEST_MIN_BYTES = 1 << 16
+DIGEST_MIN_ITEMS = 1 << 10
+
+# Size from which sequences of dicts with the same keys are encoded column by column
+# (also part of the hash keys)
+RECORDS_MIN_ITEMS = 8
+
+# How the instances of each type encountered opted in to be encoded by their digest
+# ("digest", "version" or "")
+_opt_in_types: dict[type, str] = {}
+# Digests of the objects opting in with a `__mimic_version__`, keyed by id:
+# (weak reference to the object, version, digest)
+_versioned_digests: dict[int, tuple[weakref.ref, Any, bytes]] = {}
+# Digests of large immutable builtins, keyed by id: (object, digest). Builtins cannot be
+# weakly referenced, so the objects are kept alive until `release_digests` is called
+_immutable_digests: dict[int, tuple[Any, bytes]] = {}
+
+
+class _Canonical(tuple):
+    """Canonical form of a value that pickle doesn't encode deterministically.
+
+    The first item names the kind of the value, e.g. `("set", item1, item2...)`
+    with the items in a canonical order.
+    """
+
+    __slots__ = ()
+
+
+class _CyclicReferenceError(Exception):
+    """Raised when a value contains a reference to itself."""
+
+
+def canonical_encode(obj: Any, key_encoding: int = KEY_ENCODING_VERSION) -> bytes:
+    """Encode an object into bytes that only depend on its value.
+
+    Unlike plain pickle, the encoding doesn't depend on the iteration order of sets, the
+    insertion order of dicts, or whether equal objects happen to be the same object.
+
+    Containers are converted to a canonical form (dicts and sets are sorted, dataclasses
+    are reduced to their fields, sequences of dicts with the same keys are converted to
+    columns), which is then pickled without memo, so that the heavy lifting is still done
+    by pickle's C implementation. Dicts and sequences that already are in canonical form
+    are kept as they are. Other objects are pickled as they
+    are, or encoded with their string representation if they cannot be pickled. Objects
+    that reference themselves fall back to plain pickle.
+
+    Some objects are encoded by a digest, which is memoized by object identity:
+    - Large immutable builtins (bytes, and tuples and frozensets of atomic values)
+    - Instances of classes declaring a `__mimic_version__` attribute, which must change
+      whenever the object is mutated (e.g. a generation counter). Their digest is
+      recomputed when it changes.
+    - Instances of classes with a `__mimic_digest__()` method, returning a digest of their
+      content as str or bytes. It's called every time the object is encoded.
+
+    Args:
+        obj: The object to encode
+        key_encoding: The version of the encoding, older versions only being used to migrate
+            the keys of old recordings (version 1 doesn't encode single objects,
+            see `update_pickled`)
+
+    Returns:
+        The canonical encoding of the object
+
+    Raises:
+        ValueError: If the version of the encoding is unknown
+    """
+    if key_encoding != KEY_ENCODING_VERSION:
+        if key_encoding != 2:
+            raise ValueError(f"Unknown key encoding version {key_encoding}")
+        token = _use_digests.set(False)
+        try:
+            return canonical_encode(obj)
+        finally:
+            _use_digests.reset(token)
+
+    try:
+        try:
+            return b"c" + _dumps(_canonicalize(obj, set(), _keep))
+        except (pickle.PickleError, TypeError, AttributeError):
+            # Encode the parts that can't be pickled with their string representation
+            return b"c" + _dumps(_canonicalize(obj, set(), _picklable_or_str))
+    except (_CyclicReferenceError, RecursionError, ValueError):
+        # Pickle without memo cannot encode cycles
+        return _encode_cyclic(obj)
+
+
+def update_canonical(
+    write: Callable[[bytes], Any], obj: Any, key_encoding: int = KEY_ENCODING_VERSION
+) -> None:
+    """Write the length-prefixed canonical encoding of an object.
+
+    Args:
+        write: Callback receiving the encoding, typically the `update` method of a hash object
+        obj: The object to encode
+        key_encoding: The version of the encoding (see `canonical_encode`)
+    """
+    encoded = canonical_encode(obj, key_encoding)
+    write(b"%d:" % len(encoded))
+    write(encoded)
+
+
+def update_pickled(write: Callable[[bytes], Any], args: tuple, kwargs: dict) -> None:
+    """Write the arguments of a call as encoded by version 1 of the encoding: plain pickle.
+
+    The encoding depends on the insertion order of dicts and the iteration order of sets,
+    so it's only used to migrate the keys of old recordings.
+
+    Args:
+        write: Callback receiving the encoding, typically the `update` method of a hash object
+        args: Positional arguments of the call
+        kwargs: Keyword arguments of the call
+    """
+    for arg in args:
+        write(_pickle_or_str(arg))
+    for key in sorted(kwargs):
+        write(key.encode("utf-8"))
+        write(_pickle_or_str(kwargs[key]))
+
+
+def _pickle_or_str(obj: Any) -> bytes:
+    try:
+        return pickle.dumps(obj)
+    except (pickle.PickleError, TypeError):
+        # Fallback if object can't be pickled
+        return str(obj).encode("utf-8")
+
+
+def _canonicalize(obj: Any, path: set[int], convert_other: Callable[[Any], Any]) -> Any:
+    """Convert an object into a form that pickle encodes deterministically.
+
+    Args:
+        obj: The object to convert
+        path: Ids of the containers being converted, to detect cycles
+        convert_other: Conversion of the objects without a canonical form
+
+    Returns:
+        The canonical form of the object, which may be the object itself
+
+    Raises:
+        _CyclicReferenceError: If the object references itself
+    """
+    obj_type = type(obj)
+    if obj_type in _ATOMIC_TYPES:
+        if obj_type is bytes and len(obj) >= DIGEST_MIN_BYTES and _use_digests.get():
+            return _immutable_digest(obj, obj_type, path, convert_other)
+        return obj
+
+    if obj_type in _CONTAINER_TYPES:
+        if (
+            (obj_type is tuple or obj_type is frozenset)
+            and len(obj) >= DIGEST_MIN_ITEMS
+            and _use_digests.get()
+        ):
+            entry = _immutable_digests.get(id(obj))
+            if (entry is not None and entry[0] is obj) or _ATOMIC_TYPES.issuperset(map(type, obj)):
+                return _immutable_digest(obj, obj_type, path, convert_other)
+    else:
+        if obj_type is LazyResult:
+            # Lazily replayed results are encoded like the result itself
+            return _canonicalize(resolve_lazy(obj), path, convert_other)
+        opt_in = _opt_in_types.get(obj_type)
+        if opt_in is None:
+            opt_in = _opt_in_types[obj_type] = _opt_in(obj_type)
+        if opt_in and _use_digests.get():
+            if opt_in == "digest":
+                return _Canonical(("digest", _type_name(obj_type), obj.__mimic_digest__()))
+            return _versioned_digest(obj, obj_type, path, convert_other)
+        if not dataclasses.is_dataclass(obj) or isinstance(obj, type):
+            return convert_other(obj)
+
+    obj_id = id(obj)
+    if obj_id in path:
+        raise _CyclicReferenceError()
+    path.add(obj_id)
+    try:
+        return _canonicalize_container(obj, obj_type, path, convert_other)
+    finally:
+        path.discard(obj_id)
+
+
+def _canonicalize_container(
+    obj: Any, obj_type: type, path: set[int], convert_other: Callable[[Any], Any]
+) -> Any:
+    if obj_type is list or obj_type is tuple:
+        if _ATOMIC_TYPES_EXCEPT_BYTES.issuperset(map(type, obj)) or (
+            _ATOMIC_TYPES.issuperset(map(type, obj))
+            and all(type(item) is not bytes or len(item) < DIGEST_MIN_BYTES for item in obj)
+        ):
+            # Nothing to convert (the common case of sequences of primitives)
+            return obj
+        item_types = set(map(type, obj))
+        if len(item_types) == 1:
+            # Convert sequences of dicts or sequences in bulk, as they are often large tables
+            item_type = item_types.pop()
+            if item_type is dict and len(obj) >= RECORDS_MIN_ITEMS:
+                records = _canonicalize_records(obj, obj_type, path, convert_other)
+                if records is not None:
+                    return records
+            elif (item_type is list or item_type is tuple) and _is_table(obj, item_type):
+                return obj
+        return obj_type([_canonicalize(item, path, convert_other) for item in obj])
+
+    if obj_type is dict:
+        # Rebuild the dict in a canonical key order, as pickle encodes it in insertion order
+        if _is_sortable(obj):
+            keys = sorted(obj)
+            values = list(map(obj.__getitem__, keys))
+            canonical_values = _canonicalize_container(values, list, path, convert_other)
+            if canonical_values is values and keys == list(obj):
+                # Already in canonical form
+                return obj
+            if type(canonical_values) is list:
+                return dict(zip(keys, canonical_values))
+            # The values were converted to columns
+            return _Canonical(("dict", tuple(keys), canonical_values))
+        items = [
+            (_canonicalize(key, path, convert_other), _canonicalize(value, path, convert_other))
+            for key, value in obj.items()
+        ]
+        return dict(sorted(items, key=lambda item: _dumps(item[0])))
+
+    if obj_type is set or obj_type is frozenset:
+        if _is_sortable(obj):
+            items = sorted(obj)
+        else:
+            items = sorted((_canonicalize(item, path, convert_other) for item in obj), key=_dumps)
+        return _Canonical((obj_type.__name__, *items))
+
+    return _Canonical(
+        (
+            "dataclass",
+            _type_name(obj_type),
+            *(
+                (field.name, _canonicalize(getattr(obj, field.name), path, convert_other))
+                for field in dataclasses.fields(obj)
+            ),
+        )
+    )
+
+
+def _canonicalize_records(
+    records: Any, obj_type: type, path: set[int], convert_other: Callable[[Any], Any]
+) -> Optional[_Canonical]:
+    """Get the canonical form of a sequence of dicts with the same keys, as columns of values.
+
+    Returns:
+        The canonical form, or None if the dicts don't have the same sortable keys
+    """
+    key_types = set(map(type, itertools.chain.from_iterable(records)))
+    if len(key_types) != 1 or key_types.pop() not in _SORTABLE_TYPES:
+        return None
+    shapes = set(map(tuple, records))
+    keys = sorted(shapes.pop())
+    if any(sorted(shape) != keys for shape in shapes):
+        return None
+    columns = (
+        _canonicalize_container(
+            list(map(operator.itemgetter(key), records)), list, path, convert_other
+        )
+        for key in keys
+    )
+    return _Canonical(("records", obj_type.__name__, tuple(keys), *columns))
+
+
+def _is_table(rows: Any, row_type: type) -> bool:
+    """Check whether sequences of sequences only contain values that don't need converting."""
+    if row_type is tuple and max(map(len, rows)) >= DIGEST_MIN_ITEMS:
+        return False
+    return _ATOMIC_TYPES_EXCEPT_BYTES.issuperset(map(type, itertools.chain.from_iterable(rows)))
+
+
+def _opt_in(obj_type: type) -> str:
+    """Check whether the instances of a type opted in to be encoded by their digest."""
+    if hasattr(obj_type, "__mimic_digest__"):
+        return "digest"
+    if hasattr(obj_type, "__mimic_version__"):
+        return "version"
+    return ""
+
+
+def _immutable_digest(
+    obj: Any, obj_type: type, path: set[int], convert_other: Callable[[Any], Any]
+) -> _Canonical:
+    """Get the canonical form of a large immutable builtin: its memoized digest."""
+    entry = _immutable_digests.get(id(obj))
+    if entry is not None and entry[0] is obj:
+        digest = entry[1]
+    else:
+        if obj_type is bytes:
+            digest = hashlib.blake2b(obj, digest_size=32).digest()
+        else:
+            digest = _digest(_canonicalize_container(obj, obj_type, path, convert_other))
+        _immutable_digests[id(obj)] = (obj, digest)
+    return _Canonical(("digest", obj_type.__name__, digest))
+
+
+def _versioned_digest(
+    obj: Any, obj_type: type, path: set[int], convert_other: Callable[[Any], Any]
+) -> _Canonical:
+    """Get the canonical form of an object with a version: its digest, memoized per version."""
+    obj_id = id(obj)
+    version = obj.__mimic_version__
+    entry = _versioned_digests.get(obj_id)
+    if entry is not None and entry[0]() is obj and entry[1] == version:
+        digest = entry[2]
+    else:
+        if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+            path.add(obj_id)
+            try:
+                digest = _digest(_canonicalize_container(obj, obj_type, path, convert_other))
+            finally:
+                path.discard(obj_id)
+        else:
+            digest = _digest(convert_other(obj))
+        try:
+            ref = weakref.ref(obj, lambda ref: _forget_versioned_digest(obj_id, ref))
+        except TypeError:
+            # Objects that cannot be weakly referenced are digested on every call
+            pass
+        else:
+            _versioned_digests[obj_id] = (ref, version, digest)
+    return _Canonical(("digest", _type_name(obj_type), digest))
+
+
+def _forget_versioned_digest(obj_id: int, ref: weakref.ref) -> None:
+    entry = _versioned_digests.get(obj_id)
+    if entry is not None and entry[0] is ref:
+        del _versioned_digests[obj_id]
+
+
+def release_digests() -> None:
+    """Forget the memoized digests of immutable builtins, releasing the objects.
+
+    The digests of objects with a `__mimic_version__` are weakly referenced, and forgotten
+    when their object is garbage collected.
+    """
+    _immutable_digests.clear()
+    # Also release the types, as some libraries create one per object (e.g. mocks)
+    _opt_in_types.clear()
+
+
+def _digest(canonical: Any) -> bytes:
+    return hashlib.blake2b(_dumps(canonical), digest_size=32).digest()
+
+
+def _type_name(obj_type: type) -> str:
+    return f"{obj_type.__module__}.{obj_type.__qualname__}"
+
+
+def _is_sortable(items) -> bool:
+    """Check whether items can be ordered by value, because they all have the same simple type."""
+    item_types = set(map(type, items))
+    return len(item_types) == 1 and item_types.pop() in _SORTABLE_TYPES
+
+
+def _dumps(obj: Any) -> bytes:
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=PICKLE_PROTOCOL)
+    # Without memo, equal objects are encoded the same way whether or not they are the same object.
+    # Objects referenced several times are encoded every time though, which is exponential in
+    # the depth of DAGs sharing sub-objects, unless they opt in to be encoded by their digest
+    pickler.fast = True
+    pickler.dump(obj)
+    return buffer.getvalue()
+
+
+def _encode_cyclic(obj: Any) -> bytes:
+    try:
+        return b"p" + pickle.dumps(obj, protocol=PICKLE_PROTOCOL)
+    except (pickle.PickleError, TypeError, AttributeError):
+        # Fallback if object can't be pickled
+        return b"r" + str(obj).encode("utf-8", "surrogatepass")
+
+
+def _keep(obj: Any) -> Any:
+    return obj
+
+
+def _picklable_or_str(obj: Any) -> Any:
+    try:
+        pickle.dumps(obj, protocol=PICKLE_PROTOCOL)
+    except (pickle.PickleError, TypeError, AttributeError):
+        # Fallback if object can't be pickled
+        return _Canonical(("str", str(obj)))
+    return obj
@@ -0,0 +1,68 @@
+import hashlib
+
+DEFAULT_HASH_ALGORITHM = "sha256"
+HASH_ALGORITHMS = ("sha256", "blake2b", "xxh3")
+
+
+def new_hasher(algorithm: str):
+    """Create a hash object for one of the supported algorithms.
+
+    - `sha256`: the default, used by vaults created before the algorithm was configurable
+    - `blake2b`: faster than SHA-256 on most CPUs, from the standard library
+    - `xxh3`: non-cryptographic and much faster, requires the `xxhash` package
+
+    Args:
+        algorithm: The name of the hash algorithm
+
+    Returns:
+        A hash object with `update` and `hexdigest` methods
+
+    Raises:
+        ValueError: If the algorithm is not supported
+        ImportError: If the algorithm requires a package that isn't installed
+    """
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=32)
+    if algorithm == "xxh3":
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError(
+                "The xxh3 mimic hash algorithm requires the xxhash package."
+                " Install it with: pip install xxhash"
+            ) from None
+        return xxhash.xxh3_128()
+    raise ValueError(
+        f"Unknown mimic hash algorithm '{algorithm}'."
+        f" Supported algorithms: {', '.join(HASH_ALGORITHMS)}"
+    )
+
+
+def key_prefix(algorithm: str) -> str:
+    """Get the prefix of the keys hashed with an algorithm.
+
+    Keys hashed with the default algorithm have no prefix, so that vaults created
+    before the algorithm was configurable keep their keys.
+
+    Args:
+        algorithm: The name of the hash algorithm
+
+    Returns:
+        The prefix of the keys, e.g. "blake2b-"
+    """
+    return "" if algorithm == DEFAULT_HASH_ALGORITHM else f"{algorithm}-"
+
+
+def key_algorithm(key: str) -> str:
+    """Get the algorithm a key was hashed with, from its prefix.
+
+    Args:
+        key: A hash key or blob digest
+
+    Returns:
+        The name of the hash algorithm
+    """
+    prefix, separator, _ = key.partition("-")
+    return prefix if separator else DEFAULT_HASH_ALGORITHM
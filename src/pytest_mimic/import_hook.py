@@ -0,0 +1,163 @@
+import logging
+import sys
+from importlib.abc import Loader, MetaPathFinder
+from importlib.machinery import ModuleSpec
+from typing import Callable, Optional
+
+logger = logging.getLogger("pytest_mimic")
+
+
+class DeferredMimicFinder(MetaPathFinder):
+    """Import hook installing mimic targets only once their module is imported.
+
+    Importing every configured target at startup makes pytest startup time grow with
+    the number (and weight) of the targets, even for runs that never call them.
+    Instead, this finder locates the module holding each target without importing it,
+    and installs the target as soon as that module is imported.
+    """
+
+    def __init__(self, install: Callable[[str], None]):
+        """Create the finder.
+
+        Args:
+            install: Callback installing the mimic on a target whose module was imported
+        """
+        self._install = install
+        # Names of the modules holding a target, mapped to their pending targets
+        self._pending: dict[str, set[str]] = {}
+        # Targets whose module was imported, but which couldn't be installed
+        self._unresolved: set[str] = set()
+
+    def add_target(self, target: str) -> None:
+        """Install a target now if its module is already imported, otherwise defer it.
+
+        Args:
+            target: A string in the format "module.submodule.function_name" or
+                     "module.submodule.Class.method_name"
+
+        Raises:
+            ImportError: If the package of the target cannot be found, or if its module
+                is already imported and doesn't hold it
+        """
+        module_name = _find_module(target)
+        if module_name in sys.modules:
+            self._install(target)
+            return
+
+        self._pending.setdefault(module_name, set()).add(target)
+        logger.debug(f"Mimic: deferring installation of {target} until its module is imported")
+
+    @property
+    def unresolved_targets(self) -> set[str]:
+        """The targets that couldn't be installed, although their module was imported."""
+        imported_targets = (
+            targets for name, targets in self._pending.items() if name in sys.modules
+        )
+        return self._unresolved.union(*imported_targets)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self._pending:
+            return None
+
+        # Let the other finders find the module, and only hook into its loading
+        spec = _find_spec(fullname, path, target)
+        if spec is None:
+            return None
+
+        if spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            # Namespace packages cannot hold a target
+            return spec
+
+        spec.loader = _PostImportLoader(spec.loader, lambda: self._on_import(fullname))
+        return spec
+
+    def _on_import(self, module_name: str) -> None:
+        """Install the pending targets of a module that was just imported.
+
+        Args:
+            module_name: The name of the module that was just imported
+
+        Raises:
+            ImportError: If the module doesn't hold one of its targets
+        """
+        for target in sorted(self._pending.pop(module_name, ())):
+            try:
+                self._install(target)
+            except ImportError:
+                self._unresolved.add(target)
+                raise
+
+
+class _PostImportLoader(Loader):
+    """Loader delegating to the original loader, then calling a callback."""
+
+    def __init__(self, loader: Loader, callback: Callable[[], None]):
+        self._loader = loader
+        self._callback = callback
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._loader.exec_module(module)
+        self._callback()
+
+    def __getattr__(self, name):
+        # Expose the rest of the original loader (get_source, get_filename...)
+        return getattr(self._loader, name)
+
+
+def _find_module(target: str) -> str:
+    """Find the name of the module holding a target, without importing it.
+
+    Args:
+        target: The import path of the function or method
+
+    Returns:
+        The longest prefix of the target naming a module, the rest being attributes of it
+
+    Raises:
+        ImportError: If the top-level package of the target cannot be found
+    """
+    parts = target.split(".")
+    module_name = parts[0]
+    spec = _find_spec(module_name, None)
+    if spec is None:
+        raise ImportError(f"Failed to import function from path '{target}'")
+
+    # The last part is always an attribute, as a module cannot be mimicked
+    for part in parts[1:-1]:
+        if spec.submodule_search_locations is None:
+            break
+        submodule_spec = _find_spec(f"{module_name}.{part}", spec.submodule_search_locations)
+        if submodule_spec is None:
+            break
+        module_name, spec = f"{module_name}.{part}", submodule_spec
+    return module_name
+
+
+def _find_spec(fullname: str, path, target=None) -> Optional[ModuleSpec]:
+    """Find the spec of a module like the import system would, without importing anything.
+
+    Unlike importlib.util.find_spec, this doesn't import the parent package of a submodule,
+    so the caller must pass the search locations of the parent package.
+
+    Args:
+        fullname: The full name of the module
+        path: The search locations of the parent package, or None for a top-level module
+        target: The module object being reloaded, if any
+
+    Returns:
+        The spec of the module, or None if it cannot be found
+    """
+    module = sys.modules.get(fullname)
+    if module is not None:
+        return getattr(module, "__spec__", None) or ModuleSpec(fullname, None)
+
+    for finder in sys.meta_path:
+        if isinstance(finder, DeferredMimicFinder) or not hasattr(finder, "find_spec"):
+            continue
+        spec = finder.find_spec(fullname, path, target)
+        if spec is not None:
+            return spec
+    return None
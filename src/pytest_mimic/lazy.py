@@ -0,0 +1,272 @@
+import copy
+import operator
+import threading
+from typing import Any, Callable, Optional
+
+# Results of these types are always loaded eagerly: they're cheap to unpickle, and code
+# commonly checks them by identity (`is None`) or exact type, which a proxy cannot pass
+EAGER_TYPES = frozenset(
+    {
+        "builtins.NoneType",
+        "builtins.bool",
+        "builtins.int",
+        "builtins.float",
+        "builtins.complex",
+        "builtins.str",
+        "builtins.bytes",
+    }
+)
+
+
+def type_name(obj: Any) -> str:
+    """Get the qualified name of the type of an object, as recorded in reference files."""
+    obj_type = type(obj)
+    return f"{obj_type.__module__}.{obj_type.__qualname__}"
+
+
+def is_proxiable(result_type: Optional[str]) -> bool:
+    """Check whether a recorded result can be replayed through a `LazyResult` proxy.
+
+    Args:
+        result_type: The qualified name of the type of the result, None if it wasn't recorded
+            (recordings made by older versions)
+
+    Returns:
+        True if the result can be proxied
+    """
+    return result_type is not None and result_type not in EAGER_TYPES
+
+
+class LazyResult:
+    """Transparent proxy to a recorded result, unpickled the first time it's used.
+
+    Attribute access, operators, iteration, calls, `isinstance` checks and pickling are all
+    forwarded to the result, which is loaded on first use. A result that is only passed
+    through, or never used, is never unpickled.
+
+    A proxy is not the result itself: `type(proxy)` and identity checks see the proxy,
+    and C extensions requiring an exact type (e.g. `json.dumps` on a proxied dict) may
+    reject it. Use `resolve_lazy` to get the result in such cases.
+    """
+
+    __slots__ = ("_mimic_load", "_mimic_lock", "_mimic_value", "__weakref__")
+
+    def __init__(self, load: Callable[[], Any]):
+        """Create a proxy.
+
+        Args:
+            load: Callback loading the result
+        """
+        object.__setattr__(self, "_mimic_load", load)
+        object.__setattr__(self, "_mimic_lock", threading.Lock())
+
+    @property
+    def __class__(self):
+        # Makes isinstance() checks see the type of the result
+        return type(_resolve(self))
+
+    def __getattr__(self, name):
+        return getattr(_resolve(self), name)
+
+    def __setattr__(self, name, value):
+        setattr(_resolve(self), name, value)
+
+    def __delattr__(self, name):
+        delattr(_resolve(self), name)
+
+    def __dir__(self):
+        return dir(_resolve(self))
+
+    def __repr__(self):
+        return repr(_resolve(self))
+
+    def __str__(self):
+        return str(_resolve(self))
+
+    def __bytes__(self):
+        return bytes(_resolve(self))
+
+    def __format__(self, format_spec):
+        return format(_resolve(self), format_spec)
+
+    def __hash__(self):
+        return hash(_resolve(self))
+
+    def __bool__(self):
+        return bool(_resolve(self))
+
+    def __len__(self):
+        return len(_resolve(self))
+
+    def __iter__(self):
+        return iter(_resolve(self))
+
+    def __reversed__(self):
+        return reversed(_resolve(self))
+
+    def __next__(self):
+        return next(_resolve(self))
+
+    def __contains__(self, item):
+        return item in _resolve(self)
+
+    def __getitem__(self, key):
+        return _resolve(self)[key]
+
+    def __setitem__(self, key, value):
+        _resolve(self)[key] = value
+
+    def __delitem__(self, key):
+        del _resolve(self)[key]
+
+    def __call__(self, *args, **kwargs):
+        return _resolve(self)(*args, **kwargs)
+
+    def __enter__(self):
+        return _resolve(self).__enter__()
+
+    def __exit__(self, *exc_info):
+        return _resolve(self).__exit__(*exc_info)
+
+    def __int__(self):
+        return int(_resolve(self))
+
+    def __float__(self):
+        return float(_resolve(self))
+
+    def __complex__(self):
+        return complex(_resolve(self))
+
+    def __index__(self):
+        return operator.index(_resolve(self))
+
+    def __fspath__(self):
+        return _resolve(self).__fspath__()
+
+    def __copy__(self):
+        return copy.copy(_resolve(self))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(_resolve(self), memo)
+
+    def __reduce_ex__(self, protocol):
+        # Pickle the result itself, so that a proxy never ends up in a recording
+        return _resolve(self).__reduce_ex__(protocol)
+
+
+def _forward_operator(name: str, operation: Callable) -> None:
+    def forward(self, *args):
+        return operation(_resolve(self), *args)
+
+    forward.__name__ = name
+    setattr(LazyResult, name, forward)
+
+
+def _forward_reflected_operator(name: str, operation: Callable) -> None:
+    def forward(self, other):
+        return operation(other, _resolve(self))
+
+    forward.__name__ = name
+    setattr(LazyResult, name, forward)
+
+
+for _name, _operation in (
+    ("__eq__", operator.eq),
+    ("__ne__", operator.ne),
+    ("__lt__", operator.lt),
+    ("__le__", operator.le),
+    ("__gt__", operator.gt),
+    ("__ge__", operator.ge),
+    ("__neg__", operator.neg),
+    ("__pos__", operator.pos),
+    ("__abs__", operator.abs),
+    ("__invert__", operator.invert),
+    ("__round__", round),
+):
+    _forward_operator(_name, _operation)
+
+for _name, _operation in (
+    ("add", operator.add),
+    ("sub", operator.sub),
+    ("mul", operator.mul),
+    ("matmul", operator.matmul),
+    ("truediv", operator.truediv),
+    ("floordiv", operator.floordiv),
+    ("mod", operator.mod),
+    ("divmod", divmod),
+    ("pow", pow),
+    ("lshift", operator.lshift),
+    ("rshift", operator.rshift),
+    ("and", operator.and_),
+    ("xor", operator.xor),
+    ("or", operator.or_),
+):
+    _forward_operator(f"__{_name}__", _operation)
+    _forward_reflected_operator(f"__r{_name}__", _operation)
+
+for _name, _operation in (
+    ("add", operator.iadd),
+    ("sub", operator.isub),
+    ("mul", operator.imul),
+    ("matmul", operator.imatmul),
+    ("truediv", operator.itruediv),
+    ("floordiv", operator.ifloordiv),
+    ("mod", operator.imod),
+    ("pow", operator.ipow),
+    ("lshift", operator.ilshift),
+    ("rshift", operator.irshift),
+    ("and", operator.iand),
+    ("xor", operator.ixor),
+    ("or", operator.ior),
+):
+    # In-place operators mutate the result (or rebind the name to a new object)
+    _forward_operator(f"__i{_name}__", _operation)
+
+
+def _resolve(proxy: LazyResult) -> Any:
+    """Get the result behind a proxy, loading it on first use."""
+    try:
+        return object.__getattribute__(proxy, "_mimic_value")
+    except AttributeError:
+        pass
+
+    with object.__getattribute__(proxy, "_mimic_lock"):
+        try:
+            return object.__getattribute__(proxy, "_mimic_value")
+        except AttributeError:
+            value = object.__getattribute__(proxy, "_mimic_load")()
+            object.__setattr__(proxy, "_mimic_value", value)
+            object.__setattr__(proxy, "_mimic_load", None)
+            return value
+
+
+def is_loaded(obj: Any) -> bool:
+    """Check whether a lazily replayed result has been loaded.
+
+    Args:
+        obj: A result returned by a function mimicked with `lazy=True`
+
+    Returns:
+        True if the result was loaded, or isn't a proxy
+    """
+    if type(obj) is not LazyResult:
+        return True
+    try:
+        object.__getattribute__(obj, "_mimic_value")
+    except AttributeError:
+        return False
+    return True
+
+
+def resolve_lazy(obj: Any) -> Any:
+    """Get the actual result behind a lazily replayed result.
+
+    Args:
+        obj: A result returned by a function mimicked with `lazy=True`
+
+    Returns:
+        The loaded result, or the object itself if it isn't a proxy
+    """
+    if type(obj) is LazyResult:
+        return _resolve(obj)
+    return obj
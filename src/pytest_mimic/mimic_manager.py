@@ -1,22 +1,224 @@
 import asyncio
 import contextlib
-import hashlib
 import importlib
 import inspect
+import itertools
+import json
 import logging
 import os
 import pickle
 import pkgutil
 import sys
+import threading
+import uuid
 import warnings
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
 from functools import wraps
 from pathlib import Path
-from typing import Any, Callable, Optional
+from typing import Any, Callable, NamedTuple, Optional
+
+from .encoding import KEY_ENCODING_VERSION, update_canonical, update_pickled
+from .hashing import DEFAULT_HASH_ALGORITHM, key_algorithm, key_prefix, new_hasher
+from .import_hook import DeferredMimicFinder
+from .lazy import LazyResult, is_proxiable, type_name
+from .remote_vault import RemoteVault
+from .serializers import DEFAULT_SERIALIZER, get_serializer
 
 logger = logging.getLogger("pytest_mimic")
 
+
+class _AccessedHashes:
+    """Set of the hash keys accessed during this test run, safe to update from any thread.
+
+    Each thread adds to its own buffer, so mimicked calls fanned out over threads never
+    contend on a shared set (including on free-threaded CPython). Buffers are merged
+    whenever the set is read, typically at teardown.
+
+    Hashes are grouped by the test or fixture running when they were accessed (their owner),
+    from whichever thread they were accessed.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._buffers: list[dict[Optional[tuple[str, ...]], set]] = []
+        self._lock = threading.Lock()
+        # The ("test", nodeid) or ("fixture", baseid, name) being run, if any
+        self.owner: Optional[tuple[str, ...]] = None
+
+    def _buffer(self) -> set:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+            with self._lock:
+                self._buffers.append(buffers)
+        buffer = buffers.get(self.owner)
+        if buffer is None:
+            buffer = buffers[self.owner] = set()
+        return buffer
+
+    def add(self, hash_key: str) -> None:
+        self._buffer().add(hash_key)
+
+    def update(self, hash_keys: Iterable[str]) -> None:
+        self._buffer().update(hash_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            for buffers in self._buffers:
+                buffers.clear()
+
+    def merged(self) -> set:
+        merged = set()
+        for buffer in self.by_owner().values():
+            merged.update(buffer)
+        return merged
+
+    def by_owner(self) -> dict[Optional[tuple[str, ...]], set]:
+        with self._lock:
+            thread_buffers = [dict(buffers) for buffers in self._buffers]
+        merged = {}
+        for buffers in thread_buffers:
+            for owner, buffer in buffers.items():
+                merged.setdefault(owner, set()).update(buffer)
+        return merged
+
+    def __contains__(self, hash_key) -> bool:
+        return hash_key in self.merged()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.merged())
+
+    def __len__(self) -> int:
+        return len(self.merged())
+
+
+class _BlobCache:
+    """Raw content of the blobs recently read or written, keyed by digest, safe to use from
+    any thread.
+
+    The least recently used blobs are dropped once their total size exceeds the budget,
+    so that replaying a large vault doesn't keep every result in memory for the whole
+    session. Blobs larger than the budget are never cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            payload = self._blobs.get(digest)
+            if payload is not None:
+                self._blobs.move_to_end(digest)
+            return payload
+
+    def put(self, digest: str, payload: bytes) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._blobs.pop(digest, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._blobs[digest] = payload
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self._size -= len(evicted)
+
+    def pop(self, digest: str) -> None:
+        with self._lock:
+            payload = self._blobs.pop(digest, None)
+            if payload is not None:
+                self._size -= len(payload)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blobs.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __contains__(self, digest) -> bool:
+        return digest in self._blobs
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+
 _cache_dir: Optional[Path] = None
-_accessed_hashes: set = set()
+_accessed_hashes = _AccessedHashes()
+# Fixtures requested by each test run in this process, which share their recordings,
+# as (baseid, name) since fixtures defined in different places can have the same name
+_test_fixtures: dict[str, tuple[tuple[str, str], ...]] = {}
+
+# Locks making sure that a call missing from the vault is recorded by a single thread,
+# with the number of threads holding or waiting for them: [lock, count]
+_recording_locks: dict[str, list] = {}
+_recording_locks_lock = threading.Lock()
+
+# Node id of the pytest session, needing the recordings accessed outside of any test or
+# fixture (while collecting or importing the tests) in the test usage of the ledger
+SESSION_NODEID = ""
+# Directory (inside the vault) holding the per-process usage ledger fragments
+LEDGER_DIR_NAME = ".mimic_usage"
+# Directory (inside the vault) holding the content-addressed result blobs, and their suffix
+# (their format depends on the serializer recorded in the reference file)
+BLOBS_DIR_NAME = "blobs"
+BLOB_SUFFIX = ".blob"
+# Suffixes of the per-call files at the root of the vault:
+# references to a result blob, and (legacy) directly pickled results
+REF_SUFFIX = ".ref"
+LEGACY_SUFFIX = ".pkl"
+# Suffix of the files holding the items yielded by mimicked generators
+STREAM_SUFFIX = ".stream"
+# File (at the root of the vault) describing how its recordings are keyed
+METADATA_FILE_NAME = "mimic.json"
+VAULT_FORMAT_VERSION = 1
+
+# Import hook installing the globally configured targets once their module is imported
+_deferred_finder: Optional[DeferredMimicFinder] = None
+
+# Maximum total size of the blobs kept in memory once read, in bytes
+BLOB_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Raw content of the blobs recently read or written during this session, keyed by digest
+_blob_cache = _BlobCache(BLOB_CACHE_MAX_BYTES)
+
+# Names of the per-call files at the root of the local vault, loaded once per session
+# so that looking up a recording doesn't need to touch the filesystem
+_vault_index: Optional[set[str]] = None
+
+# Remote tier of the vault, read through when a file is missing locally
+_remote_vault: Optional[RemoteVault] = None
+# Whether the remote vault failed during this session, after which it's not read anymore
+_remote_vault_failed = False
+# Vault-relative paths of the files recorded during this session, to upload to the remote vault
+_pending_uploads: set[str] = set()
+
+# Algorithm of the hash keys and blob digests
+_hash_algorithm = DEFAULT_HASH_ALGORITHM
+# Key schemes (hash algorithm and version of the encoding of the arguments) of the
+# recordings being migrated to the configured algorithm and the current encoding, if any
+_migrate_from: set[tuple[str, int]] = set()
+# Keys of the recordings still keyed with an older encoding of the arguments, by version
+_legacy_hashes: dict[int, set[str]] = {}
+# Keys of the recordings migrated during this session, with their previous scheme
+_migrated_hashes: set[str] = set()
+# Whether the vault metadata was written (or found) during this session
+_metadata_written = False
+
+# Serializers of the results, by qualified name of their type (pickle for the other types)
+_type_serializers: dict[str, str] = {}
+
+# Results of the functions mimicked with share_result=True, unpickled once per session
+_shared_results: dict[str, Any] = {}
+_shared_results_lock = threading.Lock()
+# Target and digest of each shared result when it was loaded, to check it wasn't mutated
+_shared_digests: dict[str, tuple[str, str]] = {}
 
 
 def set_cache_dir(path: Path):
@@ -25,8 +227,69 @@ def set_cache_dir(path: Path):
     Args:
         path: Path object pointing to the mimic vault directory
     """
-    global _cache_dir
+    global _cache_dir, _vault_index, _metadata_written
     _cache_dir = path
+    _vault_index = None
+    _metadata_written = False
+    _blob_cache.clear()
+    _pending_uploads.clear()
+    _shared_results.clear()
+    _shared_digests.clear()
+
+
+def set_remote_vault(remote_vault: Optional[RemoteVault]) -> None:
+    """Set the remote vault read through when a recording is missing from the local vault.
+
+    Args:
+        remote_vault: The remote vault, or None to only use the local vault
+    """
+    global _remote_vault, _remote_vault_failed
+    _remote_vault = remote_vault
+    _remote_vault_failed = False
+
+
+def set_hash_algorithm(algorithm: str) -> None:
+    """Set the algorithm used to hash function calls and results.
+
+    Args:
+        algorithm: The name of the hash algorithm (sha256, blake2b or xxh3)
+
+    Raises:
+        ValueError: If the algorithm is not supported
+        ImportError: If the algorithm requires a package that isn't installed
+    """
+    global _hash_algorithm
+    new_hasher(algorithm)
+    _hash_algorithm = algorithm
+    _migrate_from.clear()
+    _legacy_hashes.clear()
+    _migrated_hashes.clear()
+
+
+def set_type_serializers(type_serializers: dict[str, str]) -> None:
+    """Set the serializers used to record results, depending on their type.
+
+    Args:
+        type_serializers: The name of a serializer for each qualified name of a type
+            (e.g. "numpy.ndarray"). Results of other types are pickled.
+
+    Raises:
+        ValueError: If a serializer is not registered
+        ImportError: If a serializer requires a package that isn't installed
+    """
+    for serializer in type_serializers.values():
+        get_serializer(serializer)
+    _type_serializers.clear()
+    _type_serializers.update(type_serializers)
+
+
+def get_hash_algorithm() -> str:
+    """Get the algorithm used to hash function calls and results.
+
+    Returns:
+        The name of the hash algorithm
+    """
+    return _hash_algorithm
 
 
 def get_cache_dir() -> Path:
@@ -43,7 +306,9 @@ def get_cache_dir() -> Path:
     return _cache_dir
 
 
-def try_load_result_from_cache(func, args, kwargs) -> tuple[Optional[object], Optional[str]]:
+def try_load_result_from_cache(
+    func, args, kwargs, lazy: bool = False, share: bool = False
+) -> tuple[Optional[object], Optional[str]]:
     """Try to load a recorded function call result from the mimic vault.
 
     This function attempts to retrieve a previously recorded function call result.
@@ -54,6 +319,10 @@ def try_load_result_from_cache(func, args, kwargs) -> tuple[Optional[object], Op
         func: The function being called
         args: Positional arguments to the function
         kwargs: Keyword arguments to the function
+        lazy: Whether to return a proxy loading the recorded result on first use
+            (see `LazyResult`)
+        share: Whether to return the same result object to every call with the same
+            hash key, instead of unpickling a new copy each time
 
     Returns:
         A tuple containing:
@@ -62,18 +331,34 @@ def try_load_result_from_cache(func, args, kwargs) -> tuple[Optional[object], Op
 
     Raises:
         RuntimeError: If the result is not found and we're not in record mode
+        Exception: The recorded exception, if the function call raised when recorded
     """
     hash_key = compute_hash(func, args, kwargs)
 
     global _accessed_hashes
     # Track which hashes are accessed during this test run
     _accessed_hashes.add(hash_key)
-    pickle_file = get_model_cache_path(hash_key)
     record_mode = os.environ.get("MIMIC_RECORD", "0") == "1"
-    # Load the result using pickle
-    if pickle_file.exists():
-        with open(pickle_file, "rb") as f:
-            return pickle.load(f), None
+
+    if share:
+        try:
+            return _shared_results[hash_key], None
+        except KeyError:
+            pass
+
+    found, result = _load_recorded_result(hash_key, lazy)
+    if not found and _migrate_recording(func, args, kwargs, hash_key):
+        found, result = _load_recorded_result(hash_key, lazy)
+    if not found and not record_mode:
+        # The call may have been recorded by another process since the index was loaded
+        refresh_vault_index()
+        found, result = _load_recorded_result(hash_key, lazy)
+    elif not found and _recorded_since_indexed(get_ref_path(hash_key)):
+        found, result = _load_recorded_result(hash_key, lazy)
+    if found:
+        if share:
+            result = _share_result(func, hash_key, result)
+        return result, None
 
     if not record_mode:
         raise RuntimeError(
@@ -84,8 +369,142 @@ def try_load_result_from_cache(func, args, kwargs) -> tuple[Optional[object], Op
     return None, hash_key
 
 
+def _recorded_since_indexed(path: Path) -> bool:
+    """Check whether a file missing from the vault index was recorded since it was loaded.
+
+    In record mode, this avoids calling the real function for calls recorded meanwhile by
+    another process (e.g. a sibling xdist worker), with a single existence check instead of
+    refreshing the whole index on every recorded call.
+
+    Args:
+        path: The path of the file in the local vault
+
+    Returns:
+        True if the file exists, in which case it's added to the index
+    """
+    if not path.exists():
+        return False
+    _add_to_vault_index(path)
+    return True
+
+
+def _load_recorded_result(hash_key: str, lazy: bool = False) -> tuple[bool, Any]:
+    """Load the result recorded for a function call.
+
+    Args:
+        hash_key: The unique hash key for the function call
+        lazy: Whether to return a proxy loading the result on first use. Results of types
+            that cannot be proxied (see `is_proxiable`), recorded exceptions and recordings
+            made by older versions are loaded right away.
+
+    Returns:
+        A tuple containing:
+        - Whether the call has been recorded
+        - The recorded result (or None if not found)
+
+    Raises:
+        Exception: The recorded exception, if the function call raised when recorded
+    """
+    ref = _load_ref(hash_key)
+    # Recordings made by older versions don't name their serializer: they're pickled
+    serializer = get_serializer((ref or {}).get("serializer", "pickle"))
+    if lazy and ref is not None:
+        result_type = ref.get("type")
+        if is_proxiable(result_type) and result_type != _RECORDED_EXCEPTION_TYPE:
+            digest = ref["digest"]
+            return True, LazyResult(lambda: serializer.loads(_load_blob(digest)))
+
+    if ref is not None:
+        payload = _load_blob(ref["digest"])
+    else:
+        payload = _load_legacy_payload(hash_key)
+    if payload is None:
+        return False, None
+
+    # Deserialize on every call so that callers never share (and mutate) the same object
+    result = serializer.loads(payload)
+    if isinstance(result, RecordedException):
+        raise result.rebuild()
+    return True, result
+
+
+def _share_result(func: Callable, hash_key: str, result: Any) -> Any:
+    """Keep a replayed result to return it to the next calls with the same hash key.
+
+    Args:
+        func: The function the result was recorded for
+        hash_key: The unique hash key for the function call
+        result: The result, just unpickled
+
+    Returns:
+        The shared result, which is another one if a concurrent thread shared it first
+    """
+    with _shared_results_lock:
+        if hash_key in _shared_results:
+            return _shared_results[hash_key]
+        _shared_results[hash_key] = result
+
+    if os.environ.get("MIMIC_CHECK_SHARED", "0") == "1":
+        target = f"{func.__module__}.{func.__qualname__}"
+        _shared_digests[hash_key] = (target, _digest_result(result))
+    return result
+
+
+def _digest_result(result: Any) -> str:
+    """Compute the digest of the canonical encoding of a result."""
+    hasher = new_hasher(_hash_algorithm)
+    update_canonical(hasher.update, result)
+    return hasher.hexdigest()
+
+
+def check_shared_results() -> list[str]:
+    """Check that the results shared between the calls of a mimicked function weren't mutated.
+
+    Only the results shared while the check was enabled (`--mimic-check-shared`) are checked.
+
+    Returns:
+        The targets whose shared results were mutated
+    """
+    mutated = set()
+    for hash_key, (target, digest) in list(_shared_digests.items()):
+        if _digest_result(_shared_results[hash_key]) != digest:
+            mutated.add(target)
+    return sorted(mutated)
+
+
+@contextlib.contextmanager
+def _recording_lock(hash_key: str):
+    """Hold the lock to record a function call, so that concurrent threads record it only once.
+
+    Args:
+        hash_key: The unique hash key for the function call
+    """
+    with _recording_locks_lock:
+        entry = _recording_locks.get(hash_key)
+        if entry is None:
+            entry = _recording_locks[hash_key] = [threading.RLock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        # Forget the lock once the call is recorded, so that locks don't pile up
+        with _recording_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _recording_locks[hash_key]
+
+
 @contextlib.contextmanager
-def mimic(target: str, classmethod_warning: bool = True):
+def mimic(
+    target: str,
+    classmethod_warning: bool = True,
+    batch_arg: Optional[str] = None,
+    record_exceptions: bool = False,
+    lazy: bool = False,
+    share_result: bool = False,
+    serializer: Optional[str] = None,
+):
     """Context manager that intercepts calls to a function and records or replays its behavior.
 
     Args:
@@ -95,12 +514,26 @@ def mimic(target: str, classmethod_warning: bool = True):
                     "module.submodule.Class.method_name"
         classmethod_warning: Whether to issue a warning when mimicking classmethods
             that might mutate class state (default: True)
+        batch_arg: Name of an argument holding a batch of items, for functions that
+            return one result per item. Each item is then recorded separately, and
+            only the items missing from the vault are passed to the real function.
+        record_exceptions: Whether to record exceptions raised by the function in record mode,
+            and raise them again on replay (default: False)
+        lazy: Whether to replay results as proxies that only unpickle the recorded result
+            when it's first used (default: False). See `LazyResult` for the limitations.
+        share_result: Whether to unpickle each recorded result once per session, and return
+            the same object to every call (default: False). Only use it for results that
+            are never mutated, which `--mimic-check-shared` verifies at the end of the run.
+        serializer: Name of the serializer recording the results (e.g. "json"), instead of
+            the one configured for their type in mimic_serializers, or pickle. Results
+            that the serializer cannot replay exactly are pickled.
 
     Yields:
         None: This context manager doesn't yield a value
 
     Raises:
-        ValueError: If attempting to mimic a method bound to an instance
+        ValueError: If attempting to mimic a method bound to an instance, or if the options
+            cannot be combined
 
     Examples:
         >>> with mimic(expensive_function):
@@ -109,14 +542,120 @@ def mimic(target: str, classmethod_warning: bool = True):
         >>> # Mimicking a class method
         >>> with mimic(MyClass.class_method):
         ...     result = function_that_calls_class_method()
+
+        >>> # Mimicking a bulk API item by item
+        >>> with mimic("api.fetch_users", batch_arg="ids"):
+        ...     users = fetch_users(ids=[1, 2, 3])
     """
 
-    parent_obj, func = _mimic(target, classmethod_warning)
-    yield
-    setattr(parent_obj, func.__name__, func)
+    options = MimicOptions(
+        batch_arg=batch_arg,
+        record_exceptions=record_exceptions,
+        lazy=lazy,
+        share_result=share_result,
+        serializer=serializer,
+    )
+    mimic_target, wrapper = _mimic(target, classmethod_warning, options)
+    try:
+        yield
+    finally:
+        mimic_target.deactivate(wrapper)
+
+
+class MimicOptions(NamedTuple):
+    """Options changing how the calls to a mimicked function are recorded and replayed."""
 
+    batch_arg: Optional[str] = None
+    record_exceptions: bool = False
+    lazy: bool = False
+    share_result: bool = False
+    serializer: Optional[str] = None
 
-def _mimic(target, classmethod_warning: bool = True):
+
+class _MimicTarget:
+    """A function or method resolved from its import path, with the wrappers built for it.
+
+    Targets are resolved once per session, and each wrapper is built once per set of
+    options. Activations are reference-counted: the innermost active wrapper is installed
+    on the parent object, and the original function is restored once none is active.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.parent_obj, self.func = _import_function_from_string(target, classmethod_warning=False)
+        self.name = self.func.__name__
+        self.module = sys.modules.get(self.func.__module__)
+        # The raw attribute, so that staticmethods and classmethods are restored as such
+        self.original = vars(self.parent_obj).get(self.name, self.func)
+        self.wrappers: dict[MimicOptions, Callable] = {}
+        # Stack of [wrapper, activation count], the last one being installed
+        self.active: list[list] = []
+
+    def is_stale(self) -> bool:
+        """Check whether the target must be resolved again.
+
+        This happens when its module was reloaded, or when something else replaced
+        the function while it wasn't mimicked.
+        """
+        if sys.modules.get(self.func.__module__) is not self.module:
+            return True
+        return (
+            not self.active and vars(self.parent_obj).get(self.name, self.func) is not self.original
+        )
+
+    def activate(self, options: MimicOptions) -> Callable:
+        """Install the wrapper for the given options, building it the first time.
+
+        Args:
+            options: The options of the wrapper to install
+
+        Returns:
+            The installed wrapper, to pass to `deactivate`
+        """
+        wrapper = self.wrappers.get(options)
+        if wrapper is None:
+            wrapper = self.wrappers[options] = _build_wrapper(self.func, options)
+
+        if self.active and self.active[-1][0] is wrapper:
+            self.active[-1][1] += 1
+        else:
+            self.active.append([wrapper, 1])
+            self._install(wrapper)
+        return wrapper
+
+    def deactivate(self, wrapper: Callable) -> None:
+        """Release an activation, restoring the previous wrapper or the original function.
+
+        Args:
+            wrapper: The wrapper returned by `activate`
+        """
+        for index in range(len(self.active) - 1, -1, -1):
+            if self.active[index][0] is wrapper:
+                self.active[index][1] -= 1
+                if self.active[index][1] == 0:
+                    del self.active[index]
+                    self._install(self.active[-1][0] if self.active else None)
+                return
+
+    def _install(self, wrapper: Optional[Callable]) -> None:
+        if wrapper is None:
+            setattr(self.parent_obj, self.name, self.original)
+        elif isinstance(self.original, (staticmethod, classmethod)):
+            # The wrapper calls the function already bound to its class (if any)
+            setattr(self.parent_obj, self.name, staticmethod(wrapper))
+        else:
+            setattr(self.parent_obj, self.name, wrapper)
+
+
+# Mimic targets resolved during this session, keyed by import path
+_targets: dict[str, _MimicTarget] = {}
+
+
+def _mimic(
+    target,
+    classmethod_warning: bool = True,
+    options: Optional[MimicOptions] = None,
+) -> tuple[_MimicTarget, Callable]:
     """Replace a function or method with a version that records or replays its behavior.
 
     This is an internal function used by both mimic() and _initialize_mimic().
@@ -125,266 +664,1738 @@ def _mimic(target, classmethod_warning: bool = True):
     Args:
         target: A string in the format "module.submodule.function_name" or
                      "module.submodule.Class.method_name"
+        classmethod_warning: Whether to issue a warning when mimicking classmethods
+        options: The options of the wrapper to install (default options if None)
+
+    Returns:
+        A tuple containing:
+        - The resolved target
+        - The installed wrapper
+    """
+    if options is None:
+        options = MimicOptions()
+
+    mimic_target = _targets.get(target)
+    if mimic_target is None or mimic_target.is_stale():
+        mimic_target = _targets[target] = _MimicTarget(target)
+
+    if classmethod_warning and inspect.ismethod(mimic_target.func):
+        _warn_classmethod(target)
+
+    return mimic_target, mimic_target.activate(options)
+
+
+def _build_wrapper(func: Callable, options: MimicOptions) -> Callable:
+    """Build a version of a function or method that records or replays its behavior.
+
+    Args:
+        func: The function or method to mimic
+        options: The options changing how calls are recorded and replayed
+
+    Returns:
+        The wrapper to install in place of the function
     """
-    parent_obj, func = _import_function_from_string(target, classmethod_warning)
+    record_exceptions = options.record_exceptions
+    lazy = options.lazy
+    share_result = options.share_result
+    if (lazy or share_result) and (
+        options.batch_arg is not None
+        or inspect.isgeneratorfunction(func)
+        or inspect.isasyncgenfunction(func)
+    ):
+        kind, option = ("Lazy", "lazy") if lazy else ("Shared", "share_result")
+        raise ValueError(
+            f"{kind} results are not supported for function {func.__name__}:"
+            f" batched functions and generators cannot be mimicked with {option}=True"
+        )
+    if lazy and share_result:
+        raise ValueError(
+            f"Function {func.__name__} cannot be mimicked with both lazy=True and share_result=True"
+        )
+    serializer = options.serializer
+    if serializer is not None:
+        if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+            raise ValueError(
+                f"Serializers are not supported for generator function {func.__name__}:"
+                f" the items it yields are always pickled"
+            )
+        get_serializer(serializer)
+    if options.batch_arg is not None:
+        if record_exceptions:
+            raise ValueError("Exceptions cannot be recorded for functions mimicked in batch mode")
+        return _batch_wrapper(func, options.batch_arg, serializer)
+    if inspect.isasyncgenfunction(func):
+        return _async_generator_wrapper(func, record_exceptions)
+    if inspect.isgeneratorfunction(func):
+        return _generator_wrapper(func, record_exceptions)
+
     if asyncio.iscoroutinefunction(func):
 
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            result, hash_key = try_load_result_from_cache(func, args, kwargs)
+            result, hash_key = try_load_result_from_cache(func, args, kwargs, lazy, share_result)
 
             if hash_key:
                 # Call the original function
-                result = await func(*args, **kwargs)
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if record_exceptions:
+                        _check_not_mutated(func, args, kwargs, hash_key)
+                        save_func_result(hash_key, RecordedException(e))
+                    raise
 
                 # Check that calling the function didn't mutate inputs
-                new_hash_key = compute_hash(func, args, kwargs)
-                if new_hash_key != hash_key:
-                    raise RuntimeError(
-                        f"Running function {func} has mutated its inputs.\n"
-                        f"Mimicking shouldn't be used on functions or methods"
-                        f" that mutate its input (or parent object)"
-                    )
+                _check_not_mutated(func, args, kwargs, hash_key)
 
                 # Save the result for future use
-                save_func_result(hash_key, result)
+                save_func_result(hash_key, result, serializer)
 
             return result
 
-        setattr(parent_obj, func.__name__, async_wrapper)
-    else:
+        return async_wrapper
 
-        @wraps(func)
-        def sync_wrapper(*args, **kwargs):
-            result, hash_key = try_load_result_from_cache(func, args, kwargs)
+    @wraps(func)
+    def sync_wrapper(*args, **kwargs):
+        result, hash_key = try_load_result_from_cache(func, args, kwargs, lazy, share_result)
+
+        if hash_key:
+            with _recording_lock(hash_key):
+                # Another thread may have recorded the same call while we were waiting
+                found, result = _load_recorded_result(hash_key, lazy)
+                if found:
+                    if share_result:
+                        result = _share_result(func, hash_key, result)
+                    return result
 
-            if hash_key:
                 # Call the original function
-                result = func(*args, **kwargs)
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if record_exceptions:
+                        _check_not_mutated(func, args, kwargs, hash_key)
+                        save_func_result(hash_key, RecordedException(e))
+                    raise
 
                 # Check that calling the function didn't mutate inputs
-                new_hash_key = compute_hash(func, args, kwargs)
-                if new_hash_key != hash_key:
-                    raise RuntimeError(
-                        f"Running function {func} has mutated its inputs.\n"
-                        f"Mimicking shouldn't be used on functions or methods"
-                        f" that mutate its input (or parent object)"
-                    )
+                _check_not_mutated(func, args, kwargs, hash_key)
 
                 # Save the result for future use
-                save_func_result(hash_key, result)
-
-            return result
+                save_func_result(hash_key, result, serializer)
 
-        setattr(parent_obj, func.__name__, sync_wrapper)
+        return result
 
-    return parent_obj, func
+    return sync_wrapper
 
 
-def compute_hash(func: Callable, args: tuple, kwargs: dict) -> str:
-    """Compute a deterministic hash for a function call.
+def _batch_wrapper(func: Callable, batch_arg: str, serializer: Optional[str] = None) -> Callable:
+    """Build a version of a bulk function or method that records each batch item separately.
 
-    This function creates a unique hash based on the function identity, its content,
-    and its inputs. The hash is used as a key to store and retrieve recorded function results.
+    The function must take a batch of items in its `batch_arg` argument and return
+    a list with one result per item, in the same order.
 
     Args:
-        func: The function being called
-        args: Positional arguments to the function
-        kwargs: Keyword arguments to the function
+        func: The function or method to mimic
+        batch_arg: Name of the argument holding the batch of items
+        serializer: Name of the serializer recording the result of each item, if any
 
     Returns:
-        A hex digest string that uniquely identifies this function call
+        The wrapper to install in place of the function
     """
-    sha256 = hashlib.sha256()
+    if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+        raise ValueError(f"Generator function {func.__name__} cannot be mimicked in batch mode")
 
-    # Hash function identity (module + name)
-    module_name = inspect.getmodule(func).__name__
-    func_name = func.__name__
-    sha256.update(f"{module_name}.{func_name}".encode())
+    signature = inspect.signature(func)
+    if batch_arg not in signature.parameters:
+        raise ValueError(f"Function {func.__name__} has no argument named '{batch_arg}' to batch")
 
-    # Hash function content (source code)
-    try:
-        source = inspect.getsource(func)
-        sha256.update(source.encode())
-    except (TypeError, OSError):
-        # Fall back if we can't get the source
-        pass
+    if asyncio.iscoroutinefunction(func):
 
-    # Hash positional arguments using pickle
-    for arg in args:
-        try:
-            pickled_arg = pickle.dumps(arg)
-            sha256.update(pickled_arg)
-        except (pickle.PickleError, TypeError):
-            # Fallback if object can't be pickled
-            sha256.update(str(arg).encode("utf-8"))
-
-    # Hash keyword arguments (sorted by key for determinism)
-    for key in sorted(kwargs.keys()):
-        sha256.update(key.encode("utf-8"))
-        try:
-            # Use pickle to get a more accurate representation
-            pickled_value = pickle.dumps(kwargs[key])
-            sha256.update(pickled_value)
-        except (pickle.PickleError, TypeError):
-            # Fallback if object can't be pickled
-            sha256.update(str(kwargs[key]).encode("utf-8"))
-
-    hash_key = sha256.hexdigest()
-    logger.debug(
-        f"Mimic: function {func.__name__} with inputs {args} and {kwargs} generated hash {hash_key}"
-    )
+        @wraps(func)
+        async def batch_async_wrapper(*args, **kwargs):
+            bound, results, missing = _lookup_batch(func, signature, batch_arg, args, kwargs)
 
-    return hash_key
+            if missing:
+                # Call the original function with the missing items only
+                missing_args, missing_kwargs = _with_batch(
+                    bound, batch_arg, [item for _, item, _ in missing]
+                )
+                missing_results = await func(*missing_args, **missing_kwargs)
+                _record_batch(func, bound, batch_arg, missing, missing_results, results, serializer)
 
+            return results
 
-def save_func_result(hash_key: str, result: Any) -> None:
-    """Save a function call result to the mimic vault.
+        return batch_async_wrapper
 
-    Args:
-        hash_key: The unique hash key for this function call
-        result: The result of the function call to save
-    """
-    global _accessed_hashes
-    # Track this hash as it's being created in this test run
-    _accessed_hashes.add(hash_key)
+    @wraps(func)
+    def batch_sync_wrapper(*args, **kwargs):
+        bound, results, missing = _lookup_batch(func, signature, batch_arg, args, kwargs)
 
-    # Ensure the cache directory exists
-    cache_dir = get_cache_dir()
-    cache_dir.mkdir(exist_ok=True, parents=True)
+        if missing:
+            # Call the original function with the missing items only
+            missing_args, missing_kwargs = _with_batch(
+                bound, batch_arg, [item for _, item, _ in missing]
+            )
+            missing_results = func(*missing_args, **missing_kwargs)
+            _record_batch(func, bound, batch_arg, missing, missing_results, results, serializer)
 
-    pickle_file = get_model_cache_path(hash_key)
-    with open(pickle_file, "wb") as f:
-        logger.debug(f"Mimic: saving to {pickle_file}")
-        pickle.dump(result, f)
+        return results
 
+    return batch_sync_wrapper
 
-def get_model_cache_path(hash_key: str) -> Path:
-    """Get the path to the pickle file for a specific function call.
+
+def _generator_wrapper(func: Callable, record_exceptions: bool = False) -> Callable:
+    """Build a version of a generator function or method that records or replays its items.
+
+    Yielded items are recorded one by one to a stream file while the real generator is
+    consumed, and replayed lazily, so memory stays bounded for long streams.
 
     Args:
-        hash_key: The unique hash key for the function call
+        func: The generator function or method to mimic
+        record_exceptions: Whether to record and replay exceptions raised by the generator
 
     Returns:
-        A Path object pointing to the pickle file location
+        The wrapper to install in place of the function
     """
-    return get_cache_dir() / f"{hash_key}.pkl"
-
 
-def get_unused_recordings() -> list[str]:
-    """Get all unused function call recordings.
+    @wraps(func)
+    def generator_wrapper(*args, **kwargs):
+        stream_file, hash_key = try_load_stream_from_cache(func, args, kwargs)
+        if stream_file is None:
+            yield from _record_generator(func, args, kwargs, hash_key, record_exceptions)
+            return
 
-    This function identifies all recorded function calls that weren't accessed
-    during the current test run. These may be obsolete recordings that are no
-    longer needed.
+        replayed_count = 0
+        try:
+            for item in _iter_stream(func, stream_file):
+                replayed_count += 1
+                yield item
+        except _PartialStreamError:
+            if os.environ.get("MIMIC_RECORD", "0") != "1":
+                raise
+            # Record the stream again, up to the items the consumer needs now
+            hash_key = os.path.splitext(stream_file.name)[0]
+            yield from _record_generator(
+                func, args, kwargs, hash_key, record_exceptions, skip=replayed_count
+            )
 
-    Returns:
-        A list of hash keys corresponding to unused recordings
-    """
-    global _accessed_hashes
-    cache_dir = get_cache_dir()
-    if not cache_dir.exists():
-        return []
+    return generator_wrapper
 
-    unused_hashes = []
-    for cache_file in cache_dir.iterdir():
-        if cache_file.suffix == ".pkl":
-            hash_key = cache_file.stem
-            if hash_key not in _accessed_hashes:
-                unused_hashes.append(hash_key)
 
-    return unused_hashes
+def _record_generator(
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    hash_key: str,
+    record_exceptions: bool,
+    skip: int = 0,
+):
+    """Call a generator function, recording the items it yields to a stream.
 
+    Args:
+        func: The generator function to call
+        args: Positional arguments to the function
+        kwargs: Keyword arguments to the function
+        hash_key: The hash key of the call
+        record_exceptions: Whether to record the exception raised by the generator
+        skip: The number of first items to record without yielding them, as they were
+            already replayed from a partial recording
 
-def clear_unused_recordings() -> int:
-    """Clear all unused function call recordings.
+    Yields:
+        The items yielded by the generator
+    """
+    writer = _StreamWriter(hash_key)
+    try:
+        try:
+            generator = func(*args, **kwargs)
+            for item in itertools.islice(generator, skip):
+                writer.write(item)
+            for item in generator:
+                writer.write(item)
+                yield item
+        except GeneratorExit:
+            # The consumer stopped early: keep what it consumed
+            writer.finish(complete=False)
+            raise
+        except Exception as e:
+            if record_exceptions:
+                _check_not_mutated(func, args, kwargs, hash_key)
+                writer.fail(e)
+            raise
+
+        _check_not_mutated(func, args, kwargs, hash_key)
+        writer.finish(complete=True)
+    finally:
+        # Discard the stream unless it was finished (e.g. if the inputs were mutated)
+        writer.abort()
+
+
+def _async_generator_wrapper(func: Callable, record_exceptions: bool = False) -> Callable:
+    """Build a version of an async generator function or method that records or replays it.
 
-    This function deletes all recorded function calls that weren't accessed
-    during the current test run. This helps keep the mimic vault size manageable
-    by removing obsolete recordings.
+    Args:
+        func: The async generator function or method to mimic
+        record_exceptions: Whether to record and replay exceptions raised by the generator
 
     Returns:
-        The number of removed recordings
+        The wrapper to install in place of the function
     """
-    unused_hashes = get_unused_recordings()
-    cache_dir = get_cache_dir()
 
-    removed_count = 0
-    for hash_key in unused_hashes:
-        cache_file = cache_dir / f"{hash_key}.pkl"
-        cache_file.unlink(missing_ok=True)
-        removed_count += 1
+    @wraps(func)
+    async def async_generator_wrapper(*args, **kwargs):
+        stream_file, hash_key = try_load_stream_from_cache(func, args, kwargs)
+        if stream_file is None:
+            async for item in _record_async_generator(
+                func, args, kwargs, hash_key, record_exceptions
+            ):
+                yield item
+            return
+
+        replayed_count = 0
+        try:
+            for item in _iter_stream(func, stream_file):
+                replayed_count += 1
+                yield item
+        except _PartialStreamError:
+            if os.environ.get("MIMIC_RECORD", "0") != "1":
+                raise
+            # Record the stream again, up to the items the consumer needs now
+            hash_key = os.path.splitext(stream_file.name)[0]
+            async for item in _record_async_generator(
+                func, args, kwargs, hash_key, record_exceptions, skip=replayed_count
+            ):
+                yield item
+
+    return async_generator_wrapper
+
+
+async def _record_async_generator(
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    hash_key: str,
+    record_exceptions: bool,
+    skip: int = 0,
+):
+    """Call an async generator function, recording the items it yields to a stream.
+
+    See `_record_generator`.
+    """
+    writer = _StreamWriter(hash_key)
+    try:
+        try:
+            async for item in func(*args, **kwargs):
+                writer.write(item)
+                if skip:
+                    skip -= 1
+                    continue
+                yield item
+        except GeneratorExit:
+            # The consumer stopped early: keep what it consumed
+            writer.finish(complete=False)
+            raise
+        except Exception as e:
+            if record_exceptions:
+                _check_not_mutated(func, args, kwargs, hash_key)
+                writer.fail(e)
+            raise
+
+        _check_not_mutated(func, args, kwargs, hash_key)
+        writer.finish(complete=True)
+    finally:
+        # Discard the stream unless it was finished (e.g. if the inputs were mutated)
+        writer.abort()
+
+
+class RecordedException:
+    """An exception raised by a mimicked function, as recorded in the mimic vault.
+
+    The exception instance itself is pickled when possible. Otherwise it is rebuilt on
+    replay from its type and arguments, falling back to their representation.
+    """
 
-    return removed_count
+    def __init__(self, exception: Exception):
+        exc_type = type(exception)
+        self.exc_type = f"{exc_type.__module__}.{exc_type.__qualname__}"
+        self.message = str(exception)
 
+        try:
+            self.pickled_exception: Optional[bytes] = pickle.dumps(exception)
+            pickle.loads(self.pickled_exception)
+        except Exception:
+            self.pickled_exception = None
 
-def _initialize_mimic(config):
-    """Initialize the mimic system and configure the mimic vault path.
+        try:
+            self.args = pickle.loads(pickle.dumps(exception.args))
+        except Exception:
+            self.args = tuple(repr(arg) for arg in exception.args)
 
-    This function is called during pytest startup. It sets up the vault directory
-    and applies mimicking to all functions specified in the configuration.
+    def rebuild(self) -> Exception:
+        """Rebuild the recorded exception so that it can be raised again.
+
+        Returns:
+            An exception of the recorded type when it can be imported, otherwise
+            a RuntimeError describing the recorded exception
+        """
+        if self.pickled_exception is not None:
+            with contextlib.suppress(Exception):
+                return pickle.loads(self.pickled_exception)
+
+        try:
+            exc_type = pkgutil.resolve_name(self.exc_type)
+            exception = exc_type.__new__(exc_type)
+            exception.args = self.args
+            return exception
+        except Exception:
+            return RuntimeError(f"Mimic-recorded exception {self.exc_type}: {self.message}")
+
+
+def _check_not_mutated(func: Callable, args: tuple, kwargs: dict, hash_key: str) -> None:
+    """Check that calling a function didn't mutate its inputs.
 
     Args:
-        config: The pytest configuration object
+        func: The function that was called
+        args: Positional arguments the function was called with
+        kwargs: Keyword arguments the function was called with
+        hash_key: The hash key computed before calling the function
+
+    Raises:
+        RuntimeError: If the inputs were mutated
     """
-    if config.getini("mimic_vault_path"):
-        cache_dir = Path(config.getini("mimic_vault_path"))
-        if not cache_dir.is_absolute():
-            cache_dir = config.rootpath.absolute() / cache_dir
-    else:
-        cache_dir = config.rootpath.absolute() / ".mimic_vault"
+    new_hash_key = compute_hash(func, args, kwargs)
+    if new_hash_key != hash_key:
+        raise RuntimeError(
+            f"Running function {func} has mutated its inputs.\n"
+            f"Mimicking shouldn't be used on functions or methods"
+            f" that mutate its input (or parent object)"
+        )
 
-    set_cache_dir(cache_dir)
 
-    # Add rootpath to path to find
-    sys.path.append(str(config.rootpath))
-    # Apply mimicking to all functions from ini configuration
-    for function_to_mimic in config.getini("mimic_functions"):
-        _mimic(function_to_mimic)
+# Type of the recorded exceptions, which must be raised on replay rather than proxied
+_RECORDED_EXCEPTION_TYPE = f"{RecordedException.__module__}.{RecordedException.__qualname__}"
 
 
-def _import_function_from_string(import_path, classmethod_warning: bool) -> tuple[object, Callable]:
-    """Import a function and its parent from an import path string.
+def try_load_stream_from_cache(func, args, kwargs) -> tuple[Optional[Path], Optional[str]]:
+    """Look up the recorded stream of items yielded by a generator call.
 
     Args:
-        import_path: A string in the format "module.submodule.function_name" or
-                     "module.submodule.Class.method_name"
+        func: The generator function being called
+        args: Positional arguments to the function
+        kwargs: Keyword arguments to the function
 
     Returns:
         A tuple containing:
-        - The parent object (module or class) that contains the function
-        - The function or method object
+        - The path to the recorded stream (or None if not found/in record mode)
+        - The hash key (only if in record mode and stream not found, otherwise None)
 
     Raises:
-        ImportError: If the function cannot be imported from the given path
-        ValueError: If the import path format is invalid
+        RuntimeError: If the stream is not found and we're not in record mode
     """
-    try:
-        callable_to_mimic = pkgutil.resolve_name(import_path)
+    hash_key = compute_hash(func, args, kwargs)
 
-        if inspect.isclass(callable_to_mimic):
-            raise ValueError(
-                f"\nAttempting to mimic class {import_path}."
-                f"\npytest-mimic cannot mimic classes. Mimic its method(s) instead"
-            )
+    global _accessed_hashes
+    # Track which hashes are accessed during this test run
+    _accessed_hashes.add(hash_key)
+    stream_file = get_stream_path(hash_key)
+    if _ensure_local(stream_file) or _migrate_recording(func, args, kwargs, hash_key):
+        return stream_file, None
+
+    if os.environ.get("MIMIC_RECORD", "0") == "1":
+        if _recorded_since_indexed(stream_file):
+            return stream_file, None
+        return None, hash_key
+
+    # The call may have been recorded by another process since the index was loaded
+    refresh_vault_index()
+    if _ensure_local(stream_file):
+        return stream_file, None
+    raise RuntimeError(
+        f"Missing mimic-recorded result for function call "
+        f"{func.__name__} with hash {hash_key}.\n"
+        f"Run pytest with --mimic-record to record responses."
+    )
 
-        if len(callable_to_mimic.__qualname__.split(".")) == 1:
-            # callable is module-level function
-            return importlib.import_module(callable_to_mimic.__module__), callable_to_mimic
 
-        if inspect.ismethod(callable_to_mimic):
-            if classmethod_warning:
-                warnings.warn(
-                    f"\nMimicking classmethod {import_path}.\n"
-                    f"Mimicking cannot check for class-level mutations caused"
-                    f" by calling this method.\n"
-                    f"If you're sure that this classmethod does not mutate its class"
-                    f" you can use\n"
-                    f"\tmimic(<your_classmethod>, classmethod_warning=False)\n"
-                    f"to suppress this warning.",
-                    stacklevel=2,
+def _iter_stream(func: Callable, stream_file: Path):
+    """Lazily replay the items of a recorded stream.
+
+    Args:
+        func: The generator function the stream was recorded for
+        stream_file: The path to the recorded stream
+
+    Yields:
+        The recorded items, read from the file one at a time
+
+    Raises:
+        RuntimeError: If the stream is truncated
+        _PartialStreamError: If more items are requested than were consumed when recording
+    """
+    with open(stream_file, "rb") as f:
+        while True:
+            try:
+                kind, value = pickle.load(f)
+            except EOFError:
+                raise RuntimeError(
+                    f"Mimic-recorded stream {stream_file.name} of function {func.__name__}"
+                    f" is truncated. Run pytest with --mimic-record to record it again."
+                ) from None
+
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value.rebuild()
+            elif value:
+                # The recording holds all the items of the original generator
+                return
+            else:
+                raise _PartialStreamError(
+                    f"Mimic-recorded stream {stream_file.name} of function {func.__name__}"
+                    f" only holds the items consumed when it was recorded.\n"
+                    f"Run pytest with --mimic-record to record more items."
                 )
 
+
+class _PartialStreamError(RuntimeError):
+    """Raised when more items are requested than were consumed when a stream was recorded."""
+
+
+class _StreamWriter:
+    """Incrementally record the items yielded by a generator to a stream file.
+
+    Each item is pickled as its own frame, followed by a final frame telling whether
+    the generator was exhausted, or holding the exception it raised.
+    The file only replaces any existing recording once finished.
+    """
+
+    def __init__(self, hash_key: str):
+        self.hash_key = hash_key
+        self.finished = False
+        self.stream_file = get_stream_path(hash_key)
+        self.stream_file.parent.mkdir(exist_ok=True, parents=True)
+        self.tmp_file = self.stream_file.with_name(
+            f"{self.stream_file.name}.{uuid.uuid4().hex}.tmp"
+        )
+        self.file = open(self.tmp_file, "wb")
+
+    def write(self, item: Any) -> None:
+        pickle.dump(("item", item), self.file)
+
+    def finish(self, complete: bool) -> None:
+        self._close(("end", complete))
+
+    def fail(self, exception: Exception) -> None:
+        self._close(("error", RecordedException(exception)))
+
+    def _close(self, final_frame: tuple) -> None:
+        global _accessed_hashes
+        _accessed_hashes.add(self.hash_key)
+
+        pickle.dump(final_frame, self.file)
+        self.file.close()
+        logger.debug(f"Mimic: saving to {self.stream_file}")
+        _ensure_vault_metadata()
+        os.replace(self.tmp_file, self.stream_file)
+        self.finished = True
+        _track_vault_file(self.stream_file)
+
+    def abort(self) -> None:
+        """Discard the stream file, unless it was finished."""
+        if self.finished:
+            return
+        self.file.close()
+        self.tmp_file.unlink(missing_ok=True)
+
+
+def _with_batch(bound: inspect.BoundArguments, batch_arg: str, items: list) -> tuple[tuple, dict]:
+    """Build the arguments of a call to a bulk function with a different batch of items.
+
+    Args:
+        bound: The bound arguments of the original call
+        batch_arg: Name of the argument holding the batch of items
+        items: The batch of items to call the function with
+
+    Returns:
+        The positional and keyword arguments of the call
+    """
+    batch_bound = inspect.BoundArguments(bound.signature, {**bound.arguments, batch_arg: items})
+    return batch_bound.args, batch_bound.kwargs
+
+
+def _lookup_batch(
+    func: Callable, signature: inspect.Signature, batch_arg: str, args: tuple, kwargs: dict
+) -> tuple[inspect.BoundArguments, list, list[tuple[int, Any, str]]]:
+    """Load the recorded result of each item of a call to a bulk function.
+
+    Args:
+        func: The function being called
+        signature: The signature of the function
+        batch_arg: Name of the argument holding the batch of items
+        args: Positional arguments to the function
+        kwargs: Keyword arguments to the function
+
+    Returns:
+        A tuple containing:
+        - The bound arguments of the call
+        - The list of results, with None for the items that weren't recorded
+        - The (index, item, hash key) of each item that wasn't recorded (only in record mode)
+
+    Raises:
+        RuntimeError: If an item is not found and we're not in record mode
+    """
+    bound = signature.bind(*args, **kwargs)
+    items = list(bound.arguments[batch_arg])
+
+    results = []
+    missing = []
+    for index, item in enumerate(items):
+        # Each item is keyed as if the function was called with a batch of just that item
+        item_args, item_kwargs = _with_batch(bound, batch_arg, [item])
+        result, hash_key = try_load_result_from_cache(func, item_args, item_kwargs)
+        results.append(result)
+        if hash_key:
+            missing.append((index, item, hash_key))
+
+    return bound, results, missing
+
+
+def _record_batch(
+    func: Callable,
+    bound: inspect.BoundArguments,
+    batch_arg: str,
+    missing: list[tuple[int, Any, str]],
+    missing_results: Any,
+    results: list,
+    serializer: Optional[str] = None,
+) -> None:
+    """Save the results of a call to a bulk function made with the missing items only.
+
+    Args:
+        func: The function that was called
+        bound: The bound arguments of the original call
+        batch_arg: Name of the argument holding the batch of items
+        missing: The (index, item, hash key) of each item the function was called with
+        missing_results: The results returned by the function
+        results: The results of the full batch, filled in place
+        serializer: Name of the serializer recording the result of each item, if any
+    """
+    missing_results = list(missing_results)
+    if len(missing_results) != len(missing):
+        raise RuntimeError(
+            f"Batched function {func.__name__} returned {len(missing_results)} results"
+            f" for a batch of {len(missing)} items.\n"
+            f"Batch mimicking requires one result per item, in the same order."
+        )
+
+    for (index, item, hash_key), result in zip(missing, missing_results):
+        # Check that calling the function didn't mutate inputs
+        item_args, item_kwargs = _with_batch(bound, batch_arg, [item])
+        _check_not_mutated(func, item_args, item_kwargs, hash_key)
+
+        # Save the result for future use
+        save_func_result(hash_key, result, serializer)
+        results[index] = result
+
+
+def compute_hash(
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    algorithm: Optional[str] = None,
+    key_encoding: int = KEY_ENCODING_VERSION,
+) -> str:
+    """Compute a deterministic hash for a function call.
+
+    This function creates a unique hash based on the function identity, its content,
+    and its inputs. The hash is used as a key to store and retrieve recorded function results.
+
+    Args:
+        func: The function being called
+        args: Positional arguments to the function
+        kwargs: Keyword arguments to the function
+        algorithm: The hash algorithm to use (default: the configured algorithm)
+        key_encoding: The version of the encoding of the arguments, older versions only being
+            used to migrate the keys of old recordings
+
+    Returns:
+        A hex digest string that uniquely identifies this function call, prefixed with the
+        name of the algorithm unless it's the default one
+    """
+    algorithm = algorithm or _hash_algorithm
+    hasher = new_hasher(algorithm)
+
+    # Hash function identity (module + name)
+    module_name = inspect.getmodule(func).__name__
+    func_name = func.__name__
+    hasher.update(f"{module_name}.{func_name}".encode())
+
+    # Hash function content (source code)
+    try:
+        source = inspect.getsource(func)
+        hasher.update(source.encode())
+    except (TypeError, OSError):
+        # Fall back if we can't get the source
+        pass
+
+    if key_encoding == 1:
+        update_pickled(hasher.update, args, kwargs)
+    else:
+        # Hash the arguments with an encoding that only depends on their values
+        # (e.g. not on the iteration order of sets or the insertion order of dicts)
+        update_canonical(hasher.update, args, key_encoding)
+        update_canonical(hasher.update, kwargs, key_encoding)
+
+    hash_key = key_prefix(algorithm) + hasher.hexdigest()
+    if logger.isEnabledFor(logging.DEBUG):
+        # Formatting large inputs costs as much as hashing them
+        logger.debug(
+            f"Mimic: function {func.__name__} with inputs {args} and {kwargs}"
+            f" generated hash {hash_key}"
+        )
+
+    return hash_key
+
+
+def save_func_result(hash_key: str, result: Any, serializer: Optional[str] = None) -> None:
+    """Save a function call result to the mimic vault.
+
+    Results are stored content-addressed: the call hash maps to a reference file
+    holding the digest of the serialized result and the name of its serializer,
+    and identical results share a single blob.
+
+    Args:
+        hash_key: The unique hash key for this function call
+        result: The result of the function call to save
+        serializer: The name of the serializer to use (default: the one configured for
+            the type of the result in mimic_serializers, or pickle). Results that the
+            serializer cannot replay exactly are pickled.
+    """
+    global _accessed_hashes
+    # Track this hash as it's being created in this test run
+    _accessed_hashes.add(hash_key)
+
+    serializer_name = _select_serializer(result, serializer)
+    digest = _save_blob(get_serializer(serializer_name).dumps(result))
+
+    ref_file = get_ref_path(hash_key)
+    ref = {"digest": digest, "type": type_name(result), "serializer": serializer_name}
+    _write_vault_file(ref_file, json.dumps(ref).encode())
+
+
+def _save_blob(payload: bytes) -> str:
+    """Save a serialized result blob to the vault, unless an identical blob is already saved.
+
+    Args:
+        payload: The serialized result
+
+    Returns:
+        The digest of the blob, with the configured hash algorithm
+    """
+    hasher = new_hasher(_hash_algorithm)
+    hasher.update(payload)
+    digest = key_prefix(_hash_algorithm) + hasher.hexdigest()
+
+    blob_file = get_blob_path(digest)
+    if digest not in _blob_cache and not blob_file.exists():
+        blob_file.parent.mkdir(exist_ok=True, parents=True)
+        logger.debug(f"Mimic: saving to {blob_file}")
+        _write_vault_file(blob_file, payload)
+    _blob_cache.put(digest, payload)
+    return digest
+
+
+def _select_serializer(result: Any, serializer: Optional[str]) -> str:
+    """Select the serializer of a result.
+
+    Args:
+        result: The result to save
+        serializer: The name of the serializer selected for the function, if any
+
+    Returns:
+        The name of the serializer to use
+    """
+    if isinstance(result, RecordedException):
+        return DEFAULT_SERIALIZER
+
+    result_type = type_name(result)
+    name = serializer or _type_serializers.get(result_type, DEFAULT_SERIALIZER)
+    if name != DEFAULT_SERIALIZER and not get_serializer(name).can_serialize(result):
+        if serializer is not None:
+            logger.warning(
+                f"Mimic: a result of type {result_type} cannot be serialized with {name},"
+                f" pickling it instead"
+            )
+        return DEFAULT_SERIALIZER
+    return name
+
+
+def _load_ref(hash_key: str) -> Optional[dict]:
+    """Load the reference to the result blob recorded for a function call.
+
+    Args:
+        hash_key: The unique hash key for the function call
+
+    Returns:
+        The reference, holding the digest of the blob and the type of the result,
+        or None if the call hasn't been recorded (or was recorded by an older version)
+    """
+    ref_file = get_ref_path(hash_key)
+    if _ensure_local(ref_file):
+        return json.loads(ref_file.read_bytes())
+    return None
+
+
+def _load_blob(digest: str) -> bytes:
+    """Load a result blob, caching it in memory while it's among the most recently used.
+
+    Args:
+        digest: The digest of the blob
+
+    Returns:
+        The serialized result
+    """
+    payload = _blob_cache.get(digest)
+    if payload is None:
+        payload = _read_vault_file(get_blob_path(digest))
+        _blob_cache.put(digest, payload)
+    return payload
+
+
+def _load_legacy_payload(hash_key: str) -> Optional[bytes]:
+    """Load the pickled result of a call recorded before results were content-addressed.
+
+    Args:
+        hash_key: The unique hash key for the function call
+
+    Returns:
+        The pickled result, or None if the call hasn't been recorded
+    """
+    pickle_file = get_model_cache_path(hash_key)
+    if pickle_file.name in get_vault_index():
+        return pickle_file.read_bytes()
+
+    return None
+
+
+def get_vault_index() -> set[str]:
+    """Get the names of the per-call files at the root of the local vault.
+
+    The index is loaded with a single directory scan the first time it's needed, then kept
+    up to date as recordings are added or removed, so that existence checks are set lookups.
+
+    Returns:
+        The set of file names
+    """
+    global _vault_index
+    if _vault_index is None:
+        try:
+            with os.scandir(get_cache_dir()) as entries:
+                _vault_index = {
+                    entry.name
+                    for entry in entries
+                    if os.path.splitext(entry.name)[1] in (REF_SUFFIX, LEGACY_SUFFIX, STREAM_SUFFIX)
+                }
+        except FileNotFoundError:
+            _vault_index = set()
+    return _vault_index
+
+
+def refresh_vault_index() -> None:
+    """Reload the index of the local vault, to see recordings added by other processes."""
+    global _vault_index
+    _vault_index = None
+
+
+def _ensure_local(path: Path) -> bool:
+    """Check that a file exists in the local vault, downloading it from the remote vault if needed.
+
+    Args:
+        path: The path of a per-call file at the root of the local vault
+
+    Returns:
+        True if the file exists locally
+    """
+    if path.name in get_vault_index():
+        return True
+
+    data = _remote_get(_vault_key(path))
+    if data is None:
+        return False
+    _store_vault_file(path, data)
+    return True
+
+
+def _read_vault_file(path: Path) -> bytes:
+    """Read a file of the local vault, downloading it from the remote vault if needed.
+
+    Args:
+        path: The path of the file in the local vault
+
+    Returns:
+        The content of the file
+    """
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        data = _remote_get(_vault_key(path))
+        if data is None:
+            raise
+        _store_vault_file(path, data)
+        return data
+
+
+def _remote_get(key: str) -> Optional[bytes]:
+    """Download a file from the remote vault, if any.
+
+    A remote vault that fails (e.g. unreachable or timing out) is treated as missing the
+    file, and isn't read anymore during the session, so that every miss doesn't wait for it.
+
+    Args:
+        key: The path of the file relative to the vault root
+
+    Returns:
+        The content of the file, or None if it's not available remotely
+    """
+    global _remote_vault_failed
+    if _remote_vault is None or _remote_vault_failed:
+        return None
+    try:
+        return _remote_vault.get(key)
+    except OSError as e:
+        _remote_vault_failed = True
+        logger.warning(
+            f"Mimic: failed to read {key} from remote vault {_remote_vault.url} ({e}),"
+            f" only using the local vault for the rest of the session"
+        )
+        return None
+
+
+def _vault_key(path: Path) -> str:
+    """Get the path of a vault file relative to the vault root, as used by the remote vault."""
+    return path.relative_to(get_cache_dir()).as_posix()
+
+
+def _store_vault_file(path: Path, data: bytes) -> None:
+    """Write a file downloaded from the remote vault to the local vault."""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    _atomic_write(path, data)
+    _add_to_vault_index(path)
+
+
+def _add_to_vault_index(path: Path) -> None:
+    """Add a file written to the local vault to the index, if it's a per-call file."""
+    if path.parent == get_cache_dir():
+        get_vault_index().add(path.name)
+
+
+def _write_vault_file(path: Path, data: bytes) -> None:
+    """Write a file recorded during this session to the local vault.
+
+    Args:
+        path: The path of the file in the local vault
+        data: The content of the file
+    """
+    _ensure_vault_metadata()
+    _atomic_write(path, data)
+    _track_vault_file(path)
+
+
+def _ensure_vault_metadata() -> None:
+    """Write the metadata of the vault before the first file recorded during this session."""
+    global _metadata_written
+    if not _metadata_written:
+        _metadata_written = True
+        if not get_metadata_path().exists():
+            write_vault_metadata()
+
+
+def _track_vault_file(path: Path) -> None:
+    """Index a file recorded during this session, and queue it for upload to the remote vault.
+
+    Args:
+        path: The path of the file in the local vault
+    """
+    _add_to_vault_index(path)
+    if _remote_vault is not None:
+        _pending_uploads.add(_vault_key(path))
+
+
+def prefetch_remote_vault() -> int:
+    """Download all the files of the remote vault that are missing from the local vault.
+
+    Prefetching is best-effort: if the remote vault fails, the files that weren't downloaded
+    are read through (or recorded) when needed.
+
+    Returns:
+        The number of downloaded files
+    """
+    if _remote_vault is None:
+        return 0
+
+    cache_dir = get_cache_dir()
+    try:
+        missing_keys = [
+            key
+            for key in _remote_vault.list_keys()
+            if not (cache_dir / key).exists() and _is_prefetched(key)
+        ]
+        downloaded_count = _remote_vault.download(
+            missing_keys, lambda key, data: _store_vault_file(cache_dir / key, data)
+        )
+    except OSError as e:
+        logger.warning(f"Mimic: failed to prefetch remote vault {_remote_vault.url} ({e})")
+        return 0
+    logger.debug(f"Mimic: prefetched {downloaded_count} files from {_remote_vault.url}")
+    return downloaded_count
+
+
+def _is_prefetched(key: str) -> bool:
+    """Check whether a file of the remote vault should be prefetched.
+
+    Recordings keyed with another hash algorithm are skipped (unless they're being migrated),
+    as they would never be replayed.
+
+    Args:
+        key: The path of the file relative to the vault root
+    """
+    if "/" in key or key == METADATA_FILE_NAME:
+        return True
+    algorithm = key_algorithm(os.path.splitext(key)[0])
+    return algorithm == _hash_algorithm or any(
+        algorithm == migrated_algorithm for migrated_algorithm, _ in _migrate_from
+    )
+
+
+def flush_remote_uploads() -> int:
+    """Upload the files recorded during this session to the remote vault.
+
+    Returns:
+        The number of uploaded files
+    """
+    if _remote_vault is None or not _pending_uploads:
+        return 0
+
+    cache_dir = get_cache_dir()
+
+    def load(key: str) -> Optional[bytes]:
+        local_file = cache_dir / key
+        return local_file.read_bytes() if local_file.exists() else None
+
+    uploaded_count = _remote_vault.upload(sorted(_pending_uploads), load)
+    _pending_uploads.clear()
+    logger.debug(f"Mimic: uploaded {uploaded_count} files to {_remote_vault.url}")
+    return uploaded_count
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Write a file so that concurrent readers never see it partially written.
+
+    Args:
+        path: The path of the file to write
+        data: The content of the file
+    """
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def get_model_cache_path(hash_key: str) -> Path:
+    """Get the path to the legacy pickle file for a specific function call.
+
+    Args:
+        hash_key: The unique hash key for the function call
+
+    Returns:
+        A Path object pointing to the pickle file location
+    """
+    return get_cache_dir() / f"{hash_key}{LEGACY_SUFFIX}"
+
+
+def get_ref_path(hash_key: str) -> Path:
+    """Get the path to the file referencing the result blob of a specific function call.
+
+    Args:
+        hash_key: The unique hash key for the function call
+
+    Returns:
+        A Path object pointing to the reference file location
+    """
+    return get_cache_dir() / f"{hash_key}{REF_SUFFIX}"
+
+
+def get_stream_path(hash_key: str) -> Path:
+    """Get the path to the stream file of a specific generator call.
+
+    Args:
+        hash_key: The unique hash key for the generator call
+
+    Returns:
+        A Path object pointing to the stream file location
+    """
+    return get_cache_dir() / f"{hash_key}{STREAM_SUFFIX}"
+
+
+def get_blob_path(digest: str) -> Path:
+    """Get the path to a content-addressed result blob.
+
+    Args:
+        digest: The digest of the serialized result
+
+    Returns:
+        A Path object pointing to the blob file location
+    """
+    return get_cache_dir() / BLOBS_DIR_NAME / f"{digest}{BLOB_SUFFIX}"
+
+
+def get_recorded_hashes() -> set[str]:
+    """Get the hash keys of all the function calls recorded in the mimic vault.
+
+    Returns:
+        A set of hash keys
+    """
+    return {os.path.splitext(name)[0] for name in get_vault_index()}
+
+
+def get_unused_recordings(use_ledger: bool = False, run_id: Optional[str] = None) -> list[str]:
+    """Get all unused function call recordings.
+
+    This function identifies all recorded function calls that weren't accessed
+    during the current test run. These may be obsolete recordings that are no
+    longer needed.
+
+    Args:
+        use_ledger: Whether to also count as used every hash found in the persistent
+            usage ledger (see `write_usage_ledger`). This makes the result safe for
+            partial runs and CI shards.
+        run_id: The id of an xdist run, to also count as used every hash accessed by
+            its workers
+
+    Returns:
+        A list of hash keys corresponding to unused recordings
+    """
+    global _accessed_hashes
+    used_hashes = _accessed_hashes.merged()
+    if use_ledger:
+        used_hashes.update(load_usage_ledger())
+    if run_id is not None:
+        used_hashes.update(load_usage_ledger(run_id))
+
+    return sorted(get_recorded_hashes() - used_hashes)
+
+
+def clear_unused_recordings(use_ledger: bool = False, run_id: Optional[str] = None) -> int:
+    """Clear all unused function call recordings.
+
+    This function deletes all recorded function calls that weren't accessed
+    during the current test run. This helps keep the mimic vault size manageable
+    by removing obsolete recordings.
+
+    Args:
+        use_ledger: Whether to keep every recording used according to the persistent
+            usage ledger. The ledger is reset afterwards, starting a new generation.
+        run_id: The id of an xdist run, to keep every recording used by its workers
+
+    Returns:
+        The number of removed recordings
+    """
+    unused_hashes = get_unused_recordings(use_ledger=use_ledger, run_id=run_id)
+
+    removed_count = 0
+    vault_index = get_vault_index()
+    for hash_key in unused_hashes:
+        for cache_file in (
+            get_ref_path(hash_key),
+            get_model_cache_path(hash_key),
+            get_stream_path(hash_key),
+        ):
+            cache_file.unlink(missing_ok=True)
+            vault_index.discard(cache_file.name)
+        removed_count += 1
+
+    if removed_count:
+        _clear_orphan_blobs()
+
+    if use_ledger:
+        reset_usage_ledger()
+
+    return removed_count
+
+
+def _clear_orphan_blobs() -> None:
+    """Remove the result blobs that aren't referenced by any recording anymore."""
+    blobs_dir = get_cache_dir() / BLOBS_DIR_NAME
+    if not blobs_dir.exists():
+        return
+
+    cache_dir = get_cache_dir()
+    referenced_digests = {
+        json.loads((cache_dir / name).read_bytes())["digest"]
+        for name in get_vault_index()
+        if name.endswith(REF_SUFFIX)
+    }
+    for blob_file in blobs_dir.glob(f"*{BLOB_SUFFIX}"):
+        if blob_file.stem not in referenced_digests:
+            blob_file.unlink(missing_ok=True)
+            _blob_cache.pop(blob_file.stem)
+
+
+def get_metadata_path() -> Path:
+    """Get the path to the metadata file of the mimic vault.
+
+    Returns:
+        A Path object pointing to the metadata file
+    """
+    return get_cache_dir() / METADATA_FILE_NAME
+
+
+def load_vault_metadata() -> Optional[dict]:
+    """Load the metadata of the mimic vault.
+
+    Returns:
+        The metadata, with the format version of the vault, the algorithm of its hash keys,
+        the version of the encoding of the arguments they hash and the keys of the recordings
+        still keyed with an older encoding, or None if the vault has no metadata file (empty
+        vault or vault created by an older version, keyed with SHA-256 and version 1)
+    """
+    try:
+        return json.loads(_read_vault_file(get_metadata_path()))
+    except FileNotFoundError:
+        return None
+
+
+def write_vault_metadata() -> None:
+    """Write the metadata of the mimic vault, recording the configured hash algorithm.
+
+    The recordings that are still keyed with an older encoding of the arguments, because
+    their migration isn't finished, are listed, as their keys don't tell it.
+    """
+    metadata_file = get_metadata_path()
+    metadata_file.parent.mkdir(exist_ok=True, parents=True)
+    metadata = {
+        "version": VAULT_FORMAT_VERSION,
+        "hash_algorithm": _hash_algorithm,
+        "key_encoding": KEY_ENCODING_VERSION,
+    }
+    if _legacy_hashes:
+        metadata["legacy_hashes"] = {
+            str(key_encoding): sorted(hashes) for key_encoding, hashes in _legacy_hashes.items()
+        }
+    _atomic_write(metadata_file, json.dumps(metadata).encode())
+    if _remote_vault is not None:
+        _pending_uploads.add(METADATA_FILE_NAME)
+
+
+def check_vault_metadata(migrate: bool = False) -> None:
+    """Check that the recordings of the vault are keyed like the calls of this session.
+
+    They must be keyed with the configured hash algorithm, and the encoding of the arguments
+    of this version of pytest-mimic.
+
+    Args:
+        migrate: Whether the recordings keyed with another algorithm or an older encoding are
+            migrated during this run: they get a new key when replayed,
+            see `finish_hash_migration`
+
+    Raises:
+        RuntimeError: If the vault was written by a newer version of pytest-mimic, or holds
+            recordings keyed with an older encoding of the arguments, or another algorithm
+            (or several algorithms), unless they are migrated
+    """
+    metadata = load_vault_metadata()
+    if metadata is not None and metadata.get("version", 1) > VAULT_FORMAT_VERSION:
+        raise RuntimeError(
+            f"Mimic vault {get_cache_dir()} has format version {metadata['version']},"
+            f" which is not supported by this version of pytest-mimic. Upgrade pytest-mimic."
+        )
+
+    recorded_hashes = get_recorded_hashes()
+    # Vaults without metadata, or without the encoding in their metadata, predate it
+    key_encoding = 1 if metadata is None else metadata.get("key_encoding", 1)
+    if key_encoding > KEY_ENCODING_VERSION and recorded_hashes:
+        raise RuntimeError(
+            f"Mimic vault {get_cache_dir()} holds recordings keyed with version"
+            f" {key_encoding} of the encoding of the arguments, but this version of"
+            f" pytest-mimic uses version {KEY_ENCODING_VERSION}, so they would never be"
+            f" replayed. Upgrade pytest-mimic."
+        )
+    if key_encoding < KEY_ENCODING_VERSION:
+        legacy_hashes = {key_encoding: recorded_hashes}
+    else:
+        legacy_hashes = {
+            int(version): recorded_hashes.intersection(hashes)
+            for version, hashes in metadata.get("legacy_hashes", {}).items()
+        }
+    legacy_hashes = {version: hashes for version, hashes in legacy_hashes.items() if hashes}
+
+    if legacy_hashes and not migrate:
+        legacy_count = sum(map(len, legacy_hashes.values()))
+        versions = ", ".join(map(str, sorted(legacy_hashes)))
+        raise RuntimeError(
+            f"Mimic vault {get_cache_dir()} holds {legacy_count} recordings keyed with"
+            f" version {versions} of the encoding of the arguments, but this version of"
+            f" pytest-mimic uses version {KEY_ENCODING_VERSION}, so they would never be"
+            f" replayed.\n"
+            f"Run pytest with --mimic-migrate-hash to rewrite their keys."
+        )
+
+    schemes = {(key_algorithm(hash_key), KEY_ENCODING_VERSION) for hash_key in recorded_hashes}
+    for version, hashes in legacy_hashes.items():
+        schemes.update((key_algorithm(hash_key), version) for hash_key in hashes)
+    if metadata is not None:
+        schemes.add((metadata["hash_algorithm"], KEY_ENCODING_VERSION))
+    vault_algorithms = {algorithm for algorithm, _ in schemes}
+    if vault_algorithms - {_hash_algorithm} and not migrate:
+        raise RuntimeError(
+            f"Mimic vault {get_cache_dir()} holds recordings keyed with"
+            f" {', '.join(sorted(vault_algorithms))}, but the configured hash algorithm"
+            f" is '{_hash_algorithm}'.\n"
+            f"Run pytest with --mimic-migrate-hash to rewrite their keys with '{_hash_algorithm}',"
+            f" or set mimic_hash_algorithm to the algorithm of the vault."
+        )
+
+    _legacy_hashes.clear()
+    _legacy_hashes.update(legacy_hashes)
+    _migrate_from.clear()
+    _migrate_from.update(schemes - {(_hash_algorithm, KEY_ENCODING_VERSION)})
+    if _migrate_from:
+        logger.info(f"Mimic: migrating recordings to {_hash_algorithm}")
+
+    if metadata is not None and (
+        key_encoding != KEY_ENCODING_VERSION
+        or len(metadata.get("legacy_hashes", {})) != len(legacy_hashes)
+    ):
+        # Record which recordings are still keyed with an older encoding, as recordings keyed
+        # with the current encoding may be added to the vault from now on
+        write_vault_metadata()
+
+
+def _migrate_recording(func: Callable, args: tuple, kwargs: dict, hash_key: str) -> bool:
+    """Copy the recording of a call keyed with a scheme being migrated from to its new key.
+
+    Args:
+        func: The function being called
+        args: Positional arguments to the function
+        kwargs: Keyword arguments to the function
+        hash_key: The key of the call with the configured algorithm and current encoding
+
+    Returns:
+        True if a recording was migrated
+    """
+    for algorithm, key_encoding in sorted(_migrate_from):
+        old_hash_key = compute_hash(
+            func, args, kwargs, algorithm=algorithm, key_encoding=key_encoding
+        )
+        if old_hash_key != hash_key and _copy_recording(old_hash_key, hash_key):
+            _migrated_hashes.add(old_hash_key)
+            logger.debug(f"Mimic: migrated recording {old_hash_key} to {hash_key}")
+            return True
+    return False
+
+
+def _copy_recording(old_hash_key: str, hash_key: str) -> bool:
+    """Copy the recording of a call to another key.
+
+    Args:
+        old_hash_key: The key of the recording
+        hash_key: The new key of the recording
+
+    Returns:
+        True if there was a recording to copy
+    """
+    copied = False
+    ref = _load_ref(old_hash_key)
+    if ref is not None:
+        # Also rewrite the digest of the blob, so that the result isn't stored twice when
+        # recording it again, or an identical result, with the configured algorithm
+        ref["digest"] = _save_blob(_load_blob(ref["digest"]))
+        _write_vault_file(get_ref_path(hash_key), json.dumps(ref).encode())
+        copied = True
+    for old_file, new_file in (
+        (get_model_cache_path(old_hash_key), get_model_cache_path(hash_key)),
+        (get_stream_path(old_hash_key), get_stream_path(hash_key)),
+    ):
+        if _ensure_local(old_file):
+            _write_vault_file(new_file, _read_vault_file(old_file))
+            copied = True
+    return copied
+
+
+def finish_hash_migration(run_id: Optional[str] = None) -> tuple[int, int]:
+    """Complete a migration started by `check_vault_metadata(migrate=True)`.
+
+    The recordings migrated during the run are removed from their previous key, and the
+    vault metadata is updated. The recordings that weren't replayed (e.g. deselected, or run
+    by another shard) are kept, as their new key is unknown: they are migrated by the next
+    runs with --mimic-migrate-hash, or can be removed by runs with both --mimic-migrate-hash
+    and --mimic-clear-unused.
+
+    Args:
+        run_id: The id of an xdist run, to also complete the migrations of its workers
+
+    Returns:
+        A tuple containing:
+        - The number of recordings migrated during the run
+        - The number of recordings still keyed with another algorithm or an older encoding
+    """
+    if not _migrate_from:
+        return 0, 0
+
+    # Recordings whose key didn't change with the encoding were replayed with their key
+    replayed_hashes = _accessed_hashes.merged()
+    if run_id is not None:
+        _migrated_hashes.update(_load_run_migrations(run_id))
+        replayed_hashes.update(load_usage_ledger(run_id))
+        # See the recordings migrated by the workers
+        refresh_vault_index()
+
+    vault_index = get_vault_index()
+    for old_hash_key in _migrated_hashes:
+        for old_file in (
+            get_ref_path(old_hash_key),
+            get_model_cache_path(old_hash_key),
+            get_stream_path(old_hash_key),
+        ):
+            if old_file.name in vault_index:
+                old_file.unlink(missing_ok=True)
+                vault_index.discard(old_file.name)
+    for version, hashes in list(_legacy_hashes.items()):
+        hashes.difference_update(_migrated_hashes, replayed_hashes)
+        if not hashes:
+            del _legacy_hashes[version]
+    remaining_hashes = set().union(*_legacy_hashes.values())
+    remaining_hashes.update(
+        hash_key for hash_key in get_recorded_hashes() if key_algorithm(hash_key) != _hash_algorithm
+    )
+
+    _clear_orphan_blobs()
+    write_vault_metadata()
+    _migrate_from.clear()
+    _legacy_hashes.clear()
+    migrated_count = len(_migrated_hashes)
+    _migrated_hashes.clear()
+    return migrated_count, len(remaining_hashes)
+
+
+def _load_run_migrations(run_id: str) -> set[str]:
+    """Merge the previous keys of the recordings migrated by the workers of an xdist run.
+
+    Args:
+        run_id: The id of the xdist run
+
+    Returns:
+        The previous keys of the recordings migrated by any worker
+    """
+    migrated_hashes: set[str] = set()
+    for fragment in get_ledger_dir(run_id).glob("*.json"):
+        try:
+            migrated_hashes.update(json.loads(fragment.read_text()).get("migrated", []))
+        except (OSError, ValueError):
+            logger.warning(f"Mimic: ignoring unreadable usage ledger fragment {fragment}")
+    return migrated_hashes
+
+
+def get_ledger_dir(run_id: Optional[str] = None) -> Path:
+    """Get the directory holding the usage ledger fragments.
+
+    Args:
+        run_id: The id of an xdist run, to get the directory of the fragments written by its
+            workers instead, which are only kept until the end of the run
+
+    Returns:
+        A Path object pointing to the usage ledger directory inside the mimic vault
+    """
+    ledger_dir = get_cache_dir() / LEDGER_DIR_NAME
+    if run_id is not None:
+        return ledger_dir / f"run-{run_id}"
+    return ledger_dir
+
+
+def start_test_usage(nodeid: str, fixtures: Iterable[tuple[str, str]]) -> None:
+    """Attribute the recordings accessed from now on to a test.
+
+    Args:
+        nodeid: The node id of the test
+        fixtures: The (baseid, name) of the fixtures requested by the test
+    """
+    _test_fixtures[nodeid] = tuple(fixtures)
+    _accessed_hashes.owner = ("test", nodeid)
+
+
+def stop_test_usage() -> None:
+    """Stop attributing the recordings accessed from now on to a test."""
+    _accessed_hashes.owner = None
+
+
+@contextlib.contextmanager
+def fixture_usage(baseid: str, fixture_name: str):
+    """Attribute the recordings accessed in the context to a fixture.
+
+    Fixtures shared by several tests (module or session scoped) are set up by the first
+    test requesting them: their recordings are attributed to every test requesting them.
+
+    Args:
+        baseid: The node id of the directory, module or class defining the fixture
+            ("" for fixtures defined by plugins)
+        fixture_name: The name of the fixture being set up
+    """
+    previous_owner = _accessed_hashes.owner
+    _accessed_hashes.owner = ("fixture", baseid, fixture_name)
+    try:
+        yield
+    finally:
+        _accessed_hashes.owner = previous_owner
+
+
+def get_test_usage() -> dict[str, set[str]]:
+    """Get the hashes accessed by each test run in this process.
+
+    Returns:
+        A dictionary mapping the node id of each test to the hash keys it needs,
+        including the ones accessed by the shared fixtures it requests. The hash keys
+        accessed outside of any test or fixture are mapped to `SESSION_NODEID`.
+    """
+    by_owner = _accessed_hashes.by_owner()
+    test_usage = {}
+    for nodeid, fixtures in _test_fixtures.items():
+        hashes = set(by_owner.get(("test", nodeid), ()))
+        for baseid, fixture_name in fixtures:
+            hashes.update(by_owner.get(("fixture", baseid, fixture_name), ()))
+        if hashes:
+            test_usage[nodeid] = hashes
+    if by_owner.get(None):
+        test_usage[SESSION_NODEID] = set(by_owner[None])
+    return test_usage
+
+
+def write_usage_ledger(run_id: Optional[str] = None) -> Optional[Path]:
+    """Persist the hashes accessed by this process to the usage ledger.
+
+    Every process (test run, CI shard or xdist worker) writes its own fragment,
+    so concurrent writers never conflict. Fragments are merged by `load_usage_ledger`.
+    Fragments also map each test to the hashes it needs (see `load_test_usage`).
+
+    Args:
+        run_id: The id of the xdist run of this worker, to write the fragment apart from the
+            persistent ledger, for the controller of the run only. These fragments also
+            hold the previous keys of the recordings migrated by the worker, so that the
+            controller finishes their migration (see `finish_hash_migration`).
+
+    Returns:
+        The path of the written fragment, or None if no recording was accessed
+    """
+    global _accessed_hashes
+    accessed_hashes = _accessed_hashes.merged()
+    if not accessed_hashes:
+        return None
+
+    ledger_dir = get_ledger_dir(run_id)
+    ledger_dir.mkdir(exist_ok=True, parents=True)
+
+    fragment = ledger_dir / f"{uuid.uuid4().hex}.json"
+    tmp_fragment = fragment.with_suffix(".tmp")
+    test_usage = {nodeid: sorted(hashes) for nodeid, hashes in get_test_usage().items()}
+    usage = {"hashes": sorted(accessed_hashes), "tests": test_usage}
+    if run_id is not None:
+        usage["migrated"] = sorted(_migrated_hashes)
+    tmp_fragment.write_text(json.dumps(usage))
+    # Atomic rename so that concurrent readers never see a partial fragment
+    os.replace(tmp_fragment, fragment)
+    logger.debug(f"Mimic: wrote usage ledger fragment {fragment}")
+    return fragment
+
+
+def load_usage_ledger(run_id: Optional[str] = None) -> set[str]:
+    """Merge all usage ledger fragments.
+
+    Args:
+        run_id: The id of an xdist run, to merge the fragments written by its workers
+            instead of the persistent ledger
+
+    Returns:
+        The hash keys used by any run
+    """
+    ledger_dir = get_ledger_dir(run_id)
+    if not ledger_dir.exists():
+        return set()
+
+    ledger: set[str] = set()
+    for fragment in ledger_dir.glob("*.json"):
+        try:
+            ledger.update(json.loads(fragment.read_text())["hashes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning(f"Mimic: ignoring unreadable usage ledger fragment {fragment}")
+
+    return ledger
+
+
+def load_test_usage() -> dict[str, set[str]]:
+    """Merge the test usage recorded in all usage ledger fragments.
+
+    Returns:
+        A dictionary mapping the node id of each test to the hash keys it needed in any run,
+        and `SESSION_NODEID` to the ones accessed outside of any test or fixture
+    """
+    ledger_dir = get_ledger_dir()
+    if not ledger_dir.exists():
+        return {}
+
+    test_usage: dict[str, set[str]] = {}
+    for fragment in ledger_dir.glob("*.json"):
+        try:
+            tests = json.loads(fragment.read_text()).get("tests", {})
+        except (OSError, ValueError):
+            logger.warning(f"Mimic: ignoring unreadable usage ledger fragment {fragment}")
+            continue
+        for nodeid, hashes in tests.items():
+            test_usage.setdefault(nodeid, set()).update(hashes)
+
+    return test_usage
+
+
+def reset_usage_ledger(run_id: Optional[str] = None) -> None:
+    """Remove all usage ledger fragments, starting a new ledger generation.
+
+    Args:
+        run_id: The id of an xdist run, to only remove the fragments written by its workers
+    """
+    ledger_dir = get_ledger_dir(run_id)
+    if not ledger_dir.exists():
+        return
+
+    for fragment in ledger_dir.glob("*.json"):
+        fragment.unlink(missing_ok=True)
+    if run_id is not None:
+        with contextlib.suppress(OSError):
+            ledger_dir.rmdir()
+
+
+def _initialize_mimic(config):
+    """Initialize the mimic system and configure the mimic vault path.
+
+    This function is called during pytest startup. It sets up the vault directory
+    and applies mimicking to all functions specified in the configuration.
+
+    Args:
+        config: The pytest configuration object
+    """
+    if config.getini("mimic_vault_path"):
+        cache_dir = Path(config.getini("mimic_vault_path"))
+        if not cache_dir.is_absolute():
+            cache_dir = config.rootpath.absolute() / cache_dir
+    else:
+        cache_dir = config.rootpath.absolute() / ".mimic_vault"
+
+    set_cache_dir(cache_dir)
+    set_hash_algorithm(config.getini("mimic_hash_algorithm"))
+    set_type_serializers(_parse_type_serializers(config.getini("mimic_serializers")))
+
+    remote_vault_url = config.getini("mimic_remote_vault")
+    set_remote_vault(RemoteVault(remote_vault_url) if remote_vault_url else None)
+
+    # Add rootpath to path to find
+    sys.path.append(str(config.rootpath))
+
+    # Apply mimicking to all functions from ini configuration, as their modules get imported
+    global _deferred_finder
+    _uninstall_deferred_mimics()
+    record_exceptions = config.getini("mimic_record_exceptions")
+    _deferred_finder = DeferredMimicFinder(
+        lambda target: _mimic(target, options=MimicOptions(record_exceptions=record_exceptions))
+    )
+    sys.meta_path.insert(0, _deferred_finder)
+    for function_to_mimic in config.getini("mimic_functions"):
+        _deferred_finder.add_target(function_to_mimic)
+
+
+def _parse_type_serializers(lines: list[str]) -> dict[str, str]:
+    """Parse the `module.Type = serializer` lines of the mimic_serializers setting.
+
+    Args:
+        lines: The lines of the setting
+
+    Returns:
+        The name of the serializer configured for each qualified name of a type
+
+    Raises:
+        ValueError: If a line isn't in this format
+    """
+    type_serializers = {}
+    for line in lines:
+        type_path, separator, serializer = (part.strip() for part in line.partition("="))
+        if not separator or not type_path or not serializer:
+            raise ValueError(
+                f"Invalid mimic_serializers entry '{line}': expected 'module.Type = serializer'"
+            )
+        type_serializers[type_path] = serializer
+    return type_serializers
+
+
+def _uninstall_deferred_mimics() -> list[str]:
+    """Stop installing globally configured mimic targets as their modules get imported.
+
+    Returns:
+        The targets that couldn't be installed although their module was imported
+    """
+    global _deferred_finder
+    if _deferred_finder is None:
+        return []
+
+    with contextlib.suppress(ValueError):
+        sys.meta_path.remove(_deferred_finder)
+    unresolved_targets = sorted(_deferred_finder.unresolved_targets)
+    _deferred_finder = None
+    return unresolved_targets
+
+
+def _warn_classmethod(import_path: str) -> None:
+    """Warn that mimicking a classmethod cannot detect mutations of its class.
+
+    Args:
+        import_path: The import path of the classmethod
+    """
+    warnings.warn(
+        f"\nMimicking classmethod {import_path}.\n"
+        f"Mimicking cannot check for class-level mutations caused"
+        f" by calling this method.\n"
+        f"If you're sure that this classmethod does not mutate its class"
+        f" you can use\n"
+        f"\tmimic(<your_classmethod>, classmethod_warning=False)\n"
+        f"to suppress this warning.",
+        stacklevel=4,
+    )
+
+
+def _import_function_from_string(import_path, classmethod_warning: bool) -> tuple[object, Callable]:
+    """Import a function and its parent from an import path string.
+
+    Args:
+        import_path: A string in the format "module.submodule.function_name" or
+                     "module.submodule.Class.method_name"
+
+    Returns:
+        A tuple containing:
+        - The parent object (module or class) that contains the function
+        - The function or method object
+
+    Raises:
+        ImportError: If the function cannot be imported from the given path
+        ValueError: If the import path format is invalid
+    """
+    try:
+        callable_to_mimic = pkgutil.resolve_name(import_path)
+
+        if inspect.isclass(callable_to_mimic):
+            raise ValueError(
+                f"\nAttempting to mimic class {import_path}."
+                f"\npytest-mimic cannot mimic classes. Mimic its method(s) instead"
+            )
+
+        if len(callable_to_mimic.__qualname__.split(".")) == 1:
+            # callable is module-level function
+            return importlib.import_module(callable_to_mimic.__module__), callable_to_mimic
+
+        if inspect.ismethod(callable_to_mimic) and classmethod_warning:
+            _warn_classmethod(import_path)
+
         parent = pkgutil.resolve_name(
             callable_to_mimic.__module__ + "." + callable_to_mimic.__qualname__.rsplit(".", 1)[0]
         )
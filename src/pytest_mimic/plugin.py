@@ -1,7 +1,33 @@
+import contextlib
 import logging
 import os
+import uuid
+from pathlib import Path
+from typing import Optional
 
-from .mimic_manager import _initialize_mimic, get_unused_recordings
+import pytest
+
+from .encoding import release_digests
+from .mimic_manager import (
+    _initialize_mimic,
+    _uninstall_deferred_mimics,
+    check_shared_results,
+    check_vault_metadata,
+    clear_unused_recordings,
+    finish_hash_migration,
+    fixture_usage,
+    flush_remote_uploads,
+    get_cache_dir,
+    get_unused_recordings,
+    mimic,
+    prefetch_remote_vault,
+    reset_usage_ledger,
+    start_test_usage,
+    stop_test_usage,
+    write_usage_ledger,
+)
+from .profiler import MimicProfiler, format_report
+from .vault_slice import export_vault_slice, import_vault_slice
 
 logger = logging.getLogger("pytest_mimic")
 
@@ -31,6 +57,49 @@ def pytest_addoption(parser):
         default=False,
         help="Fail the test run if any mimic recordings were not used",
     )
+    group.addoption(
+        "--mimic-ledger",
+        action="store_true",
+        default=False,
+        help="Record mimic usage in a persistent ledger merged across partial runs, CI shards"
+        " and xdist workers. Unused recordings are then computed over the whole ledger",
+    )
+    group.addoption(
+        "--mimic-check-shared",
+        action="store_true",
+        default=False,
+        help="Fail the test run if a result shared by a function mimicked with share_result=True"
+        " was mutated",
+    )
+    group.addoption(
+        "--mimic-migrate-hash",
+        action="store_true",
+        default=False,
+        help="Rewrite the keys of the recordings replayed during the test run with the configured"
+        " mimic_hash_algorithm and the current encoding of the arguments",
+    )
+    group.addoption(
+        "--mimic-export-slice",
+        metavar="PATH",
+        default=None,
+        help="Export the recordings needed by the selected tests to an archive, using the test"
+        " usage of the ledger. Combine with --collect-only to only export",
+    )
+    group.addoption(
+        "--mimic-import-slice",
+        metavar="PATH",
+        action="append",
+        default=[],
+        help="Import the recordings of an archive exported with --mimic-export-slice into the"
+        " vault before running the tests (can be repeated)",
+    )
+    group.addoption(
+        "--mimic-profile",
+        action="store_true",
+        default=False,
+        help="Profile the functions of the mimic_profile_modules, and the project functions doing"
+        " network, disk or subprocess I/O, and suggest which ones to mimic",
+    )
 
     parser.addini(
         "mimic_functions",
@@ -44,6 +113,57 @@ def pytest_addoption(parser):
         help="Directory to store cached function call results",
     )
 
+    parser.addini(
+        "mimic_record_exceptions",
+        type="bool",
+        help="Record exceptions raised by functions in mimic_functions and raise them on replay",
+        default=False,
+    )
+
+    parser.addini(
+        "mimic_remote_vault",
+        help="URL of a remote vault read through when a recording is missing from the local vault."
+        " New recordings are uploaded to it at the end of the test run",
+    )
+
+    parser.addini(
+        "mimic_remote_prefetch",
+        type="bool",
+        help="Download all the recordings of the remote vault missing from the local vault"
+        " at the start of the test run",
+        default=False,
+    )
+
+    parser.addini(
+        "mimic_hash_algorithm",
+        help="Algorithm used to hash function calls and results: sha256 (default), blake2b,"
+        " or xxh3 (requires the xxhash package)",
+        default="sha256",
+    )
+
+    parser.addini(
+        "mimic_profile_modules",
+        type="linelist",
+        help="Prefixes of the modules whose functions are all profiled by --mimic-profile"
+        " (e.g. myproject.clients)",
+        default=[],
+    )
+
+    parser.addini(
+        "mimic_serializers",
+        type="linelist",
+        help="Serializers recording the results of some types, one 'module.Type = serializer'"
+        " per line (e.g. builtins.dict = json). Serializers: pickle (default), json, msgpack,"
+        " npy, arrow",
+        default=[],
+    )
+
+    parser.addini(
+        "mimic_fixture_scope",
+        help="Scope of the `mimic` fixture: function (default), class, module, package or session",
+        default="function",
+    )
+
 
 def pytest_configure(config):
     """Configure pytest-mimic based on command-line options and ini settings.
@@ -71,8 +191,195 @@ def pytest_configure(config):
     else:
         os.environ["MIMIC_FAIL_ON_UNUSED"] = "0"
 
+    if config.getoption("--mimic-ledger"):
+        os.environ["MIMIC_LEDGER"] = "1"
+    else:
+        os.environ["MIMIC_LEDGER"] = "0"
+    config._mimic_run_id = _xdist_run_id(config)
+
+    if config.getoption("--mimic-check-shared"):
+        os.environ["MIMIC_CHECK_SHARED"] = "1"
+    else:
+        os.environ["MIMIC_CHECK_SHARED"] = "0"
+
+    if config.getoption("--mimic-migrate-hash"):
+        os.environ["MIMIC_MIGRATE_HASH"] = "1"
+    else:
+        os.environ["MIMIC_MIGRATE_HASH"] = "0"
+
     _initialize_mimic(config)
 
+    # xdist workers share the vault prefetched by the controller
+    if config.getini("mimic_remote_prefetch") and not hasattr(config, "workerinput"):
+        prefetch_remote_vault()
+
+    if not hasattr(config, "workerinput"):
+        for slice_path in config.getoption("--mimic-import-slice"):
+            imported_count = import_vault_slice(Path(slice_path))
+            logger.info(f"Imported {imported_count} mimic vault files from {slice_path}")
+
+    try:
+        check_vault_metadata(migrate=os.environ["MIMIC_MIGRATE_HASH"] == "1")
+    except RuntimeError as e:
+        # The vault doesn't match the configuration: report it like an invalid option
+        raise pytest.UsageError(str(e)) from None
+
+
+def _uses_xdist(config) -> bool:
+    """Check whether this process is an xdist controller or worker."""
+    return hasattr(config, "workerinput") or getattr(config.option, "dist", "no") != "no"
+
+
+def _xdist_run_id(config) -> Optional[str]:
+    """Get the id of the xdist run, under which its workers report the recordings they used.
+
+    xdist workers each only see part of the suite, so they report their usage (and the
+    recordings they migrated) to the controller through ledger fragments kept apart from the
+    persistent ledger, and removed at the end of the run.
+
+    Returns:
+        The id of the run, or None if not running with xdist
+    """
+    if not _uses_xdist(config):
+        return None
+    if hasattr(config, "workerinput"):
+        return config.workerinput.get("mimic_run_id")
+    return uuid.uuid4().hex
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """Pass the id of the run to a starting xdist worker.
+
+    Args:
+        node: The xdist node of the worker
+    """
+    run_id = getattr(node.config, "_mimic_run_id", None)
+    if run_id is not None:
+        node.workerinput["mimic_run_id"] = run_id
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtestloop(session):
+    """Profile the functions called while running the tests, if requested."""
+    config = session.config
+    if not config.getoption("--mimic-profile"):
+        yield
+        return
+
+    if _uses_xdist(config):
+        if not hasattr(config, "workerinput"):
+            logger.warning("--mimic-profile is not supported with xdist, run it with -p no:xdist")
+        yield
+        return
+
+    profiler = MimicProfiler(
+        config.rootpath,
+        module_prefixes=config.getini("mimic_profile_modules"),
+        ignored_paths=[get_cache_dir()],
+    )
+    config._mimic_profiler = profiler
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    """Attribute the recordings accessed while running a test to it."""
+    start_test_usage(item.nodeid, _requested_fixtures(item))
+    try:
+        yield
+    finally:
+        stop_test_usage()
+        # Don't keep the large arguments of the test alive once it's done
+        release_digests()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    """Attribute the recordings accessed while setting up a shared fixture to the fixture."""
+    if fixturedef.scope == "function":
+        yield
+        return
+
+    with fixture_usage(fixturedef.baseid, fixturedef.argname):
+        yield
+
+
+def _requested_fixtures(item) -> list[tuple[str, str]]:
+    """Get the (baseid, name) of the fixtures requested by a test, directly or not.
+
+    Fixtures overridden by the ones requested are included, as overrides can request them.
+    """
+    fixtureinfo = getattr(item, "_fixtureinfo", None)
+    if fixtureinfo is None:
+        return []
+    return [
+        (fixturedef.baseid, fixturedef.argname)
+        for fixturedefs in fixtureinfo.name2fixturedefs.values()
+        for fixturedef in fixturedefs
+    ]
+
+
+def pytest_collection_finish(session):
+    """Export the recordings needed by the selected tests, if requested.
+
+    Args:
+        session: The pytest session object, holding the selected tests
+    """
+    slice_path = session.config.getoption("--mimic-export-slice")
+    if slice_path is None or hasattr(session.config, "workerinput"):
+        return
+
+    nodeids = [item.nodeid for item in session.items]
+    exported_count, unknown_nodeids = export_vault_slice(Path(slice_path), nodeids)
+    logger.info(f"Exported {exported_count} mimic recordings to {slice_path}")
+    if unknown_nodeids:
+        logger.warning(
+            f"{len(unknown_nodeids)} selected tests have no recorded mimic usage"
+            f" (e.g. {unknown_nodeids[0]}), so their recordings may be missing from {slice_path}."
+            f" Run the whole suite with --mimic-ledger to record which tests use which recordings."
+        )
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """Report the functions worth mimicking found by --mimic-profile.
+
+    Args:
+        terminalreporter: The pytest terminal reporter
+        exitstatus: The exit status of the test run
+        config: The pytest configuration object
+    """
+    profiler = getattr(config, "_mimic_profiler", None)
+    if profiler is None:
+        return
+
+    terminalreporter.write_sep("=", "mimic profile")
+    for line in format_report(profiler.candidates()):
+        terminalreporter.write_line(line)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Write this process' usage ledger fragments.
+
+    This runs in xdist workers before they report back to the controller, so the
+    controller sees every fragment when it checks for unused recordings, or finishes
+    a migration.
+
+    Args:
+        session: The pytest session object
+        exitstatus: The exit status of the test run
+    """
+    if os.environ.get("MIMIC_LEDGER", "0") == "1":
+        write_usage_ledger()
+
+    run_id = getattr(session.config, "_mimic_run_id", None)
+    if run_id is not None and hasattr(session.config, "workerinput"):
+        write_usage_ledger(run_id=run_id)
+
 
 def pytest_unconfigure(config):
     """Clean up after all tests have run.
@@ -81,14 +388,74 @@ def pytest_unconfigure(config):
     1. Fails the test run if unused recordings are found and --mimic-fail-on-unused is set
     2. Removes unused recordings if --mimic-clear-unused is set
 
+    It also fails the test run if shared results were mutated and --mimic-check-shared is set,
+    or if a function configured in mimic_functions is missing from its imported module.
+
     Args:
         config: The pytest configuration object
 
     Raises:
-        RuntimeError: If unused recordings are found and --mimic-fail-on-unused is set
+        RuntimeError: If unused recordings are found and --mimic-fail-on-unused is set,
+            or if shared results were mutated and --mimic-check-shared is set
+        ImportError: If a function configured in mimic_functions is missing from its module
     """
+    unresolved_targets = _uninstall_deferred_mimics()
+
+    run_id = getattr(config, "_mimic_run_id", None)
+    if not hasattr(config, "workerinput") and os.environ.get("MIMIC_MIGRATE_HASH", "0") == "1":
+        migrated_count, remaining_count = finish_hash_migration(run_id)
+        logger.info(f"Migrated {migrated_count} mimic recordings")
+        if remaining_count:
+            logger.warning(
+                f"{remaining_count} mimic recordings weren't replayed, so they are still keyed"
+                f" with the previous hash algorithm or encoding: migrate them by running the"
+                f" rest of the tests with --mimic-migrate-hash, or remove them by running the"
+                f" tests with --mimic-migrate-hash --mimic-clear-unused"
+            )
+
+    try:
+        flush_remote_uploads()
+    except OSError as e:
+        logger.warning(f"Failed to upload new mimic recordings to the remote vault: {e}")
+
+    if os.environ.get("MIMIC_CHECK_SHARED", "0") == "1":
+        mutated_targets = check_shared_results()
+        if mutated_targets:
+            raise RuntimeError(
+                f"Shared mimic results were mutated by the tests: {', '.join(mutated_targets)}\n"
+                f"Functions mimicked with share_result=True must return results that are"
+                f" never mutated"
+            )
+
+    if unresolved_targets:
+        raise ImportError(
+            f"Failed to import the functions configured in mimic_functions from paths:"
+            f" {', '.join(unresolved_targets)}"
+        )
+
+    if hasattr(config, "workerinput"):
+        # Workers only ran a part of the suite: the controller checks the merged ledger
+        return
+
+    try:
+        _check_unused_recordings(run_id)
+    finally:
+        if run_id is not None:
+            # The usage reported by the workers is only valid for this run
+            reset_usage_ledger(run_id)
+
+
+def _check_unused_recordings(run_id: Optional[str]) -> None:
+    """Fail on or remove the unused recordings, as requested by the command line options.
 
-    unused_recordings = get_unused_recordings()
+    Args:
+        run_id: The id of the xdist run, whose workers reported the recordings they used
+
+    Raises:
+        RuntimeError: If unused recordings are found and --mimic-fail-on-unused is set
+    """
+    use_ledger = os.environ.get("MIMIC_LEDGER", "0") == "1"
+    unused_recordings = get_unused_recordings(use_ledger=use_ledger, run_id=run_id)
     unused_count = len(unused_recordings)
 
     if os.environ.get("MIMIC_FAIL_ON_UNUSED", "0") == "1" and unused_count > 0:
@@ -106,7 +473,33 @@ def pytest_unconfigure(config):
         )
 
     if os.environ.get("MIMIC_CLEAR_UNUSED", "0") == "1" and unused_count > 0:
-        from src.pytest_mimic.mimic_manager import clear_unused_recordings
-
-        removed_count = clear_unused_recordings()
+        removed_count = clear_unused_recordings(use_ledger=use_ledger, run_id=run_id)
         logger.info(f"Removed {removed_count} unused mimic recordings")
+
+
+def _mimic_fixture_scope(fixture_name, config) -> str:
+    """Get the scope of the `mimic` fixture from the ini configuration."""
+    return config.getini("mimic_fixture_scope")
+
+
+@pytest.fixture(name="mimic", scope=_mimic_fixture_scope)
+def mimic_fixture():
+    """Activate mimic targets until the end of the fixture's scope.
+
+    With a module or session scope, a target is activated once for all the tests
+    sharing the fixture, instead of being patched and restored around every test.
+
+    Yields:
+        A function taking the same arguments as the `mimic` context manager
+
+    Examples:
+        >>> def test_expensive_operation(mimic):
+        ...     mimic("module.expensive_function")
+        ...     assert function_that_calls_expensive_function() == expected_value
+    """
+    with contextlib.ExitStack() as stack:
+
+        def activate(target: str, **kwargs) -> None:
+            stack.enter_context(mimic(target, **kwargs))
+
+        yield activate
@@ -0,0 +1,344 @@
+import inspect
+import os
+import pickle
+import sys
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from .encoding import canonical_encode
+
+# Audit events revealing that a function does I/O, by kind of I/O
+IO_EVENTS = {
+    "open": "disk",
+    "os.listdir": "disk",
+    "os.scandir": "disk",
+    "shutil.copyfile": "disk",
+    "sqlite3.connect": "disk",
+    "socket.connect": "network",
+    "socket.getaddrinfo": "network",
+    "socket.sendto": "network",
+    "http.client.connect": "network",
+    "urllib.Request": "network",
+    "subprocess.Popen": "subprocess",
+    "os.system": "subprocess",
+    "os.exec": "subprocess",
+    "os.posix_spawn": "subprocess",
+    "os.spawn": "subprocess",
+}
+
+# Number of calls of each function whose arguments and result are checked
+SAMPLED_CALLS = 3
+
+_CODE_FLAGS_NOT_PROFILED = inspect.CO_GENERATOR | inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The running profiler, as audit hooks cannot be removed once added
+_active_profiler: Optional["MimicProfiler"] = None
+_audit_hook_added = False
+
+
+class Candidate(NamedTuple):
+    """Profiling results of a function that could be mimicked."""
+
+    target: str
+    calls: int
+    total_time: float
+    replay_time: float
+    io: frozenset
+    picklable: bool
+    pure: bool
+
+    @property
+    def time_saved(self) -> float:
+        """Estimated time saved per run by mimicking the function."""
+        return max(self.total_time - self.replay_time, 0.0)
+
+    @property
+    def mimickable(self) -> bool:
+        """Whether the function can be mimicked safely."""
+        return self.picklable and self.pure
+
+
+class _FunctionStats:
+    __slots__ = (
+        "target",
+        "calls",
+        "total_time",
+        "io",
+        "samples",
+        "replay_time",
+        "picklable",
+        "pure",
+    )
+
+    def __init__(self, target: str):
+        self.target = target
+        self.calls = 0
+        self.total_time = 0.0
+        self.io: set[str] = set()
+        self.samples = 0
+        # Total time it took to hash the sampled arguments and unpickle the sampled results
+        self.replay_time = 0.0
+        self.picklable = True
+        self.pure = True
+
+
+class _Call:
+    __slots__ = ("frame", "stats", "start", "args", "encoded_args", "outermost")
+
+    def __init__(self, frame, stats: _FunctionStats, start: float, outermost: bool):
+        self.frame = frame
+        self.stats = stats
+        self.start = start
+        self.outermost = outermost
+        self.args: Optional[tuple] = None
+        self.encoded_args: Optional[bytes] = None
+
+
+class MimicProfiler:
+    """Profiler measuring which functions would be worth mimicking.
+
+    Functions of the given module prefixes, and functions of the project that do network,
+    disk or subprocess I/O, are candidates. For each candidate, the profiler measures the
+    cumulative wall time and the number of calls, and checks on the first calls whether
+    its arguments and result can be pickled and whether it mutates its arguments
+    (by comparing the encoding of its arguments before and after the call, like the check
+    made when recording).
+
+    Generators and coroutines are not profiled.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        module_prefixes: Iterable[str] = (),
+        ignored_paths: Iterable[Path] = (),
+    ):
+        """Create a profiler.
+
+        Args:
+            root: The root directory of the project: its functions doing I/O are candidates,
+                except the ones defined in test files
+            module_prefixes: Prefixes of the modules whose functions are all candidates
+            ignored_paths: Directories whose files are not considered as I/O (e.g. the vault)
+        """
+        self._root = str(root.absolute()) + os.sep
+        self._module_prefixes = tuple(module_prefixes)
+        self._ignored_paths = tuple(str(path.absolute()) for path in ignored_paths)
+        self._stats: dict[Any, Optional[_FunctionStats]] = {}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self) -> None:
+        """Start profiling the calls made from any thread."""
+        global _active_profiler, _audit_hook_added
+        if not _audit_hook_added:
+            sys.addaudithook(_audit_hook)
+            _audit_hook_added = True
+        _active_profiler = self
+        threading.setprofile(self._profile)
+        sys.setprofile(self._profile)
+
+    def stop(self) -> None:
+        """Stop profiling."""
+        global _active_profiler
+        sys.setprofile(None)
+        threading.setprofile(None)
+        _active_profiler = None
+
+    def candidates(self) -> list[Candidate]:
+        """Get the profiled functions that could be mimicked.
+
+        Returns:
+            The candidates, by decreasing estimated time saved
+        """
+        candidates = []
+        for stats in list(self._stats.values()):
+            if stats is None or stats.calls == 0:
+                continue
+            prefixed = bool(self._module_prefixes) and stats.target.startswith(
+                self._module_prefixes
+            )
+            if not stats.io and not prefixed:
+                # Project functions are only candidates when they do I/O
+                continue
+            replay_time = stats.replay_time / stats.samples * stats.calls if stats.samples else 0.0
+            candidates.append(
+                Candidate(
+                    target=stats.target,
+                    calls=stats.calls,
+                    total_time=stats.total_time,
+                    replay_time=replay_time,
+                    io=frozenset(stats.io),
+                    picklable=stats.picklable,
+                    pure=stats.pure,
+                )
+            )
+        return sorted(candidates, key=lambda candidate: candidate.time_saved, reverse=True)
+
+    def _stack(self) -> list[_Call]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _function_stats(self, frame) -> Optional[_FunctionStats]:
+        """Get the stats of the function of a frame, or None if it's not profiled."""
+        code = frame.f_code
+        try:
+            return self._stats[code]
+        except KeyError:
+            pass
+
+        stats = None
+        target = self._target(frame)
+        if target is not None:
+            stats = _FunctionStats(target)
+        with self._stats_lock:
+            return self._stats.setdefault(code, stats)
+
+    def _target(self, frame) -> Optional[str]:
+        """Get the import path of the function of a frame, if it's a profiled function."""
+        code = frame.f_code
+        qualname = getattr(code, "co_qualname", code.co_name)
+        if code.co_flags & _CODE_FLAGS_NOT_PROFILED or "<" in qualname:
+            # Generators, coroutines, lambdas, nested functions and module code
+            return None
+
+        module_name = frame.f_globals.get("__name__")
+        if not module_name or module_name.split(".", 1)[0] == "pytest_mimic":
+            return None
+
+        target = f"{module_name}.{qualname}"
+        if self._module_prefixes and target.startswith(self._module_prefixes):
+            return target
+
+        filename = os.path.abspath(code.co_filename)
+        basename = os.path.basename(filename)
+        if (
+            not filename.startswith(self._root)
+            or filename.startswith(_PACKAGE_DIR)
+            or "site-packages" in filename
+            or basename.startswith("test_")
+            or basename.endswith("_test.py")
+            or basename == "conftest.py"
+        ):
+            return None
+        return target
+
+    def _profile(self, frame, event, arg) -> None:
+        if event == "call":
+            stats = self._function_stats(frame)
+            if stats is not None:
+                self._on_call(frame, stats)
+        elif event == "return":
+            stack = self._stack()
+            if stack and stack[-1].frame is frame:
+                self._on_return(stack.pop(), arg)
+
+    def _on_call(self, frame, stats: _FunctionStats) -> None:
+        stack = self._stack()
+        outermost = all(call.stats is not stats for call in stack)
+        call = _Call(frame, stats, time.perf_counter(), outermost)
+        stack.append(call)
+
+        if outermost and stats.samples < SAMPLED_CALLS:
+            code = frame.f_code
+            arg_count = code.co_argcount + code.co_kwonlyargcount
+            arg_count += bool(code.co_flags & inspect.CO_VARARGS)
+            arg_count += bool(code.co_flags & inspect.CO_VARKEYWORDS)
+            f_locals = frame.f_locals
+            call.args = tuple(f_locals.get(name) for name in code.co_varnames[:arg_count])
+
+            start = time.perf_counter()
+            try:
+                pickle.dumps(call.args)
+            except Exception:
+                stats.picklable = False
+            call.encoded_args = canonical_encode(call.args)
+            stats.replay_time += time.perf_counter() - start
+            # Don't count the sampling in the time of the function
+            call.start = time.perf_counter()
+
+    def _on_return(self, call: _Call, result: Any) -> None:
+        end = time.perf_counter()
+        stats = call.stats
+        if not call.outermost:
+            return
+
+        stats.calls += 1
+        stats.total_time += end - call.start
+        if call.encoded_args is None:
+            return
+
+        stats.samples += 1
+        if canonical_encode(call.args) != call.encoded_args:
+            stats.pure = False
+        try:
+            payload = pickle.dumps(result)
+            start = time.perf_counter()
+            pickle.loads(payload)
+            stats.replay_time += time.perf_counter() - start
+        except Exception:
+            stats.picklable = False
+
+    def _on_io(self, event: str, args: tuple) -> None:
+        if event == "open" and args and isinstance(args[0], (str, bytes, os.PathLike)):
+            path = os.path.abspath(os.fsdecode(args[0]))
+            if path.startswith(self._ignored_paths) or path.endswith((".py", ".pyc")):
+                # Replaying recordings and importing modules is not what we're looking for
+                return
+
+        kind = IO_EVENTS[event]
+        for call in self._stack():
+            call.stats.io.add(kind)
+
+
+def _audit_hook(event: str, args: tuple) -> None:
+    profiler = _active_profiler
+    if profiler is not None and event in IO_EVENTS:
+        profiler._on_io(event, args)
+
+
+def format_report(candidates: list[Candidate], limit: int = 20) -> list[str]:
+    """Format the candidates found by a profiler.
+
+    Args:
+        candidates: The candidates, by decreasing estimated time saved
+        limit: The maximum number of candidates to list
+
+    Returns:
+        The lines of the report
+    """
+    if not candidates:
+        return ["No candidate function found."]
+
+    lines = [f"{'saved':>9} {'total':>9} {'calls':>7}  {'notes':<28} target"]
+    for candidate in candidates[:limit]:
+        notes = sorted(candidate.io)
+        if not candidate.picklable:
+            notes.append("unpicklable")
+        if not candidate.pure:
+            notes.append("mutates inputs")
+        lines.append(
+            f"{candidate.time_saved:>8.3f}s {candidate.total_time:>8.3f}s {candidate.calls:>7}"
+            f"  {', '.join(notes):<28} {candidate.target}"
+        )
+
+    suggested = [
+        candidate.target
+        for candidate in candidates[:limit]
+        if candidate.mimickable and candidate.time_saved > 0
+    ]
+    lines.append("")
+    if suggested:
+        lines.append("Suggested configuration:")
+        lines.append("mimic_functions =")
+        lines.extend(f"    {target}" for target in suggested)
+    else:
+        lines.append("No candidate can be mimicked safely.")
+    return lines
@@ -0,0 +1,174 @@
+import http.client
+import threading
+import urllib.parse
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class RemoteVault:
+    """A mimic vault stored behind an HTTP endpoint, such as an object store or a plain web server.
+
+    Files are addressed by their path relative to the vault root (e.g. `<hash>.ref` or
+    `blobs/<digest>.blob`), using the following requests:
+
+    - `GET <url>/<key>`: download a file (404 if it doesn't exist)
+    - `PUT <url>/<key>`: upload a file
+    - `GET <url>/`: list all the keys, one per line
+
+    Each thread keeps its own persistent connection, so bulk transfers reuse a small
+    pool of connections instead of opening one per file.
+    """
+
+    def __init__(self, url: str, max_connections: int = 8, timeout: float = 30.0):
+        """Create a client for a remote vault.
+
+        Args:
+            url: The base URL of the remote vault
+            max_connections: Number of connections used for bulk transfers (default: 8)
+            timeout: Timeout of each request, in seconds (default: 30)
+
+        Raises:
+            ValueError: If the URL is not an http or https URL
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.netloc:
+            raise ValueError(f"Invalid remote mimic vault URL '{url}'")
+
+        self.url = url
+        self.max_connections = max_connections
+        self._scheme = parsed_url.scheme
+        self._netloc = parsed_url.netloc
+        self._base_path = parsed_url.path.rstrip("/")
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Download a file from the remote vault.
+
+        Args:
+            key: The path of the file relative to the vault root
+
+        Returns:
+            The content of the file, or None if it doesn't exist
+
+        Raises:
+            OSError: If the remote vault cannot be reached or fails to respond
+        """
+        status, body = self._request("GET", key)
+        if status == 404:
+            return None
+        if status != 200:
+            raise OSError(f"Failed to download {key} from remote mimic vault: HTTP {status}")
+        return body
+
+    def put(self, key: str, data: bytes) -> None:
+        """Upload a file to the remote vault.
+
+        Args:
+            key: The path of the file relative to the vault root
+            data: The content of the file
+
+        Raises:
+            OSError: If the remote vault cannot be reached or fails to respond
+        """
+        status, _ = self._request("PUT", key, data)
+        if status not in (200, 201, 204):
+            raise OSError(f"Failed to upload {key} to remote mimic vault: HTTP {status}")
+
+    def list_keys(self) -> list[str]:
+        """List the files stored in the remote vault.
+
+        Returns:
+            The paths of the files relative to the vault root
+
+        Raises:
+            OSError: If the remote vault cannot be reached or fails to respond
+        """
+        status, body = self._request("GET", "")
+        if status != 200:
+            raise OSError(f"Failed to list remote mimic vault: HTTP {status}")
+        return [key for key in body.decode().splitlines() if key]
+
+    def download(self, keys: Iterable[str], store: Callable[[str, bytes], None]) -> int:
+        """Download files in bulk.
+
+        Args:
+            keys: The paths of the files relative to the vault root
+            store: Callback storing the content of each downloaded file
+
+        Returns:
+            The number of downloaded files
+        """
+
+        def download_one(key: str) -> bool:
+            data = self.get(key)
+            if data is None:
+                return False
+            store(key, data)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            return sum(executor.map(download_one, keys))
+
+    def upload(self, keys: Iterable[str], load: Callable[[str], Optional[bytes]]) -> int:
+        """Upload files in bulk.
+
+        Args:
+            keys: The paths of the files relative to the vault root
+            load: Callback loading the content of each file to upload (None to skip it)
+
+        Returns:
+            The number of uploaded files
+        """
+
+        def upload_one(key: str) -> bool:
+            data = load(key)
+            if data is None:
+                return False
+            self.put(key, data)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            return sum(executor.map(upload_one, keys))
+
+    def _request(self, method: str, key: str, body: Optional[bytes] = None) -> tuple[int, bytes]:
+        path = f"{self._base_path}/{urllib.parse.quote(key)}"
+        try:
+            return self._send(method, path, body)
+        except (http.client.HTTPException, OSError):
+            # The server may have closed the kept-alive connection in the meantime
+            self._close_connection()
+
+        try:
+            return self._send(method, path, body)
+        except (http.client.HTTPException, OSError) as e:
+            self._close_connection()
+            if isinstance(e, OSError):
+                raise
+            raise OSError(f"Invalid response from remote mimic vault {self.url}: {e!r}") from e
+
+    def _close_connection(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _send(self, method: str, path: str, body: Optional[bytes]) -> tuple[int, bytes]:
+        connection = self._connection()
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = (
+                http.client.HTTPSConnection
+                if self._scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connection = self._local.connection = connection_class(
+                self._netloc, timeout=self._timeout
+            )
+        return connection
@@ -0,0 +1,247 @@
+import abc
+import importlib
+import io
+import json
+import math
+import pickle
+from typing import Any, Optional
+
+DEFAULT_SERIALIZER = "pickle"
+
+# Integers outside of this range cannot be encoded by orjson and msgpack
+_MIN_INT = -(2**63)
+_MAX_INT = 2**64 - 1
+# Nesting deeper than this is rejected by orjson
+_MAX_DEPTH = 250
+
+
+class Serializer(abc.ABC):
+    """Encoding of recorded results to bytes, and back.
+
+    Subclasses set `name`, under which they're registered and recorded in the reference
+    file of each result, and `requires`, the module they need (if any).
+    """
+
+    name: str = ""
+    requires: Optional[str] = None
+
+    def can_serialize(self, obj: Any) -> bool:
+        """Check whether an object is replayed exactly as it was when serialized.
+
+        Args:
+            obj: The object to serialize
+
+        Returns:
+            True if the serializer supports the object
+        """
+        return True
+
+    @abc.abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """Serialize an object.
+
+        Args:
+            obj: The object to serialize, supported according to `can_serialize`
+
+        Returns:
+            The serialized object
+        """
+
+    @abc.abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """Deserialize an object.
+
+        Args:
+            data: The serialized object
+
+        Returns:
+            The object
+        """
+
+
+class PickleSerializer(Serializer):
+    """Pickle, supporting (almost) any object. The default serializer."""
+
+    name = "pickle"
+
+    def dumps(self, obj: Any) -> bytes:
+        return pickle.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class JsonSerializer(Serializer):
+    """JSON, for dicts with string keys, lists, strings, numbers, booleans and None.
+
+    Uses orjson when it's installed. Its output is plain JSON, so recordings can be
+    replayed with or without it.
+    """
+
+    name = "json"
+
+    def can_serialize(self, obj: Any) -> bool:
+        return _is_json_like(obj, allow_bytes=False, depth=0)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            import orjson
+        except ImportError:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            import orjson
+        except ImportError:
+            return json.loads(data)
+        return orjson.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    """MessagePack, for the same values as JSON plus bytes."""
+
+    name = "msgpack"
+    requires = "msgpack"
+
+    def can_serialize(self, obj: Any) -> bool:
+        return _is_json_like(obj, allow_bytes=True, depth=0)
+
+    def dumps(self, obj: Any) -> bytes:
+        import msgpack
+
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        import msgpack
+
+        return msgpack.unpackb(data, raw=False)
+
+
+class NpySerializer(Serializer):
+    """The `.npy` format, for numpy arrays that don't hold Python objects."""
+
+    name = "npy"
+    requires = "numpy"
+
+    def can_serialize(self, obj: Any) -> bool:
+        import numpy
+
+        return type(obj) is numpy.ndarray and not obj.dtype.hasobject
+
+    def dumps(self, obj: Any) -> bytes:
+        import numpy
+
+        buffer = io.BytesIO()
+        numpy.save(buffer, obj, allow_pickle=False)
+        return buffer.getvalue()
+
+    def loads(self, data: bytes) -> Any:
+        import numpy
+
+        return numpy.load(io.BytesIO(data), allow_pickle=False)
+
+
+class ArrowSerializer(Serializer):
+    """The Arrow IPC stream format, for pyarrow tables."""
+
+    name = "arrow"
+    requires = "pyarrow"
+
+    def can_serialize(self, obj: Any) -> bool:
+        import pyarrow
+
+        return type(obj) is pyarrow.Table
+
+    def dumps(self, obj: Any) -> bytes:
+        import pyarrow
+
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, obj.schema) as writer:
+            writer.write_table(obj)
+        return sink.getvalue().to_pybytes()
+
+    def loads(self, data: bytes) -> Any:
+        import pyarrow
+
+        return pyarrow.ipc.open_stream(data).read_all()
+
+
+_serializers: dict[str, Serializer] = {}
+# Names of the serializers whose required module was found
+_available: set[str] = set()
+
+
+def register_serializer(serializer: Serializer) -> None:
+    """Register a serializer, replacing any serializer registered under the same name.
+
+    Args:
+        serializer: The serializer to register
+    """
+    _serializers[serializer.name] = serializer
+    _available.discard(serializer.name)
+
+
+def get_serializer(name: str) -> Serializer:
+    """Get a registered serializer.
+
+    Args:
+        name: The name of the serializer
+
+    Returns:
+        The serializer
+
+    Raises:
+        ValueError: If no serializer is registered under this name
+        ImportError: If the serializer requires a package that isn't installed
+    """
+    serializer = _serializers.get(name)
+    if serializer is None:
+        raise ValueError(
+            f"Unknown mimic serializer '{name}'. Registered serializers: {', '.join(_serializers)}"
+        )
+    if name not in _available:
+        if serializer.requires is not None:
+            try:
+                importlib.import_module(serializer.requires)
+            except ImportError:
+                raise ImportError(
+                    f"The {name} mimic serializer requires the {serializer.requires} package."
+                    f" Install it with: pip install {serializer.requires}"
+                ) from None
+        _available.add(name)
+    return serializer
+
+
+def _is_json_like(obj: Any, allow_bytes: bool, depth: int) -> bool:
+    """Check whether an object is made of values that JSON (or msgpack) replays exactly."""
+    obj_type = type(obj)
+    if obj_type is str or obj_type is bool or obj is None:
+        return True
+    if obj_type is int:
+        return _MIN_INT <= obj <= _MAX_INT
+    if obj_type is float:
+        # msgpack supports NaN and infinities, JSON doesn't
+        return allow_bytes or math.isfinite(obj)
+    if obj_type is bytes:
+        return allow_bytes
+    if depth >= _MAX_DEPTH:
+        return False
+    if obj_type is list:
+        return all(_is_json_like(item, allow_bytes, depth + 1) for item in obj)
+    if obj_type is dict:
+        return all(
+            type(key) is str and _is_json_like(value, allow_bytes, depth + 1)
+            for key, value in obj.items()
+        )
+    return False
+
+
+for _serializer in (
+    PickleSerializer(),
+    JsonSerializer(),
+    MsgpackSerializer(),
+    NpySerializer(),
+    ArrowSerializer(),
+):
+    register_serializer(_serializer)
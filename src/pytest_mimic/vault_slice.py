@@ -0,0 +1,120 @@
+import io
+import json
+import logging
+import posixpath
+import tarfile
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from .mimic_manager import (
+    METADATA_FILE_NAME,
+    REF_SUFFIX,
+    SESSION_NODEID,
+    _ensure_local,
+    _read_vault_file,
+    _store_vault_file,
+    get_blob_path,
+    get_cache_dir,
+    get_metadata_path,
+    get_model_cache_path,
+    get_ref_path,
+    get_stream_path,
+    load_test_usage,
+)
+
+logger = logging.getLogger("pytest_mimic")
+
+
+def export_vault_slice(path: Path, nodeids: Iterable[str]) -> tuple[int, list[str]]:
+    """Export the recordings needed by a selection of tests to an archive.
+
+    The tests needing each recording are known from the usage ledger, so the whole suite
+    must have run with the ledger enabled (`--mimic-ledger`) beforehand. The recordings
+    accessed outside of any test (while collecting or importing the tests) are needed by
+    every selection, so they are always exported.
+
+    Args:
+        path: The path of the archive to write (a gzipped tarball, unless it ends with `.tar`)
+        nodeids: The node ids of the selected tests
+
+    Returns:
+        A tuple containing:
+        - The number of exported recordings
+        - The node ids of the selected tests that have no recorded usage
+    """
+    test_usage = load_test_usage()
+    hash_keys = set(test_usage.get(SESSION_NODEID, ()))
+    unknown_nodeids = []
+    for nodeid in nodeids:
+        if nodeid in test_usage:
+            hash_keys.update(test_usage[nodeid])
+        else:
+            unknown_nodeids.append(nodeid)
+
+    files = {}
+    exported_count = 0
+    for hash_key in sorted(hash_keys):
+        found = False
+        for cache_file in (
+            get_ref_path(hash_key),
+            get_model_cache_path(hash_key),
+            get_stream_path(hash_key),
+        ):
+            if not _ensure_local(cache_file):
+                continue
+            found = True
+            files[cache_file] = _read_vault_file(cache_file)
+            if cache_file.suffix == REF_SUFFIX:
+                blob_file = get_blob_path(json.loads(files[cache_file])["digest"])
+                files[blob_file] = _read_vault_file(blob_file)
+        exported_count += found
+
+    metadata_file = get_metadata_path()
+    if metadata_file.exists():
+        files[metadata_file] = metadata_file.read_bytes()
+
+    mode = "w" if str(path).endswith(".tar") else "w:gz"
+    cache_dir = get_cache_dir()
+    with tarfile.open(path, mode) as archive:
+        for cache_file, data in files.items():
+            info = tarfile.TarInfo(cache_file.relative_to(cache_dir).as_posix())
+            info.size = len(data)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+
+    return exported_count, unknown_nodeids
+
+
+def import_vault_slice(path: Path) -> int:
+    """Import the recordings of an archive written by `export_vault_slice` into the vault.
+
+    Only regular files with a path inside the vault are extracted. The vault metadata
+    is only imported if the vault has none.
+
+    Args:
+        path: The path of the archive
+
+    Returns:
+        The number of imported files
+
+    Raises:
+        ValueError: If the archive holds a file outside of the vault
+    """
+    cache_dir = get_cache_dir()
+    imported_count = 0
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = posixpath.normpath(member.name)
+            if name.startswith(("/", "..")) or "\\" in name:
+                raise ValueError(f"Invalid file '{member.name}' in mimic vault slice {path}")
+            if name == METADATA_FILE_NAME and get_metadata_path().exists():
+                continue
+
+            _store_vault_file(cache_dir / name, archive.extractfile(member).read())
+            imported_count += 1
+
+    logger.debug(f"Mimic: imported {imported_count} files from {path}")
+    return imported_count
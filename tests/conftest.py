@@ -22,6 +22,9 @@ def tmp_mimic_vault():
     """
     with tempfile.TemporaryDirectory() as tmpdir:
         mimic_manager.set_cache_dir(Path(tmpdir))
+        mimic_manager.set_hash_algorithm("sha256")
+        # Also forget the serializers configured by the ini of pytester runs
+        mimic_manager.set_type_serializers({})
         yield Path(tmpdir)
 
 
@@ -34,3 +37,23 @@ def reset_record_mode():
     """
     # Set record mode to off by default
     os.environ["MIMIC_RECORD"] = "0"
+    os.environ["MIMIC_CHECK_SHARED"] = "0"
+
+
+@pytest.fixture
+def replay_from_disk(tmp_mimic_vault):
+    """Start new replay sessions on the temporary mimic vault.
+
+    Sessions forget the results cached in memory while recording, so that they're
+    replayed from the files of the vault.
+
+    Returns:
+        Callable: Function starting a session, optionally checking shared results
+    """
+
+    def replay(check_shared=False):
+        mimic_manager.set_cache_dir(tmp_mimic_vault)
+        os.environ["MIMIC_RECORD"] = "0"
+        os.environ["MIMIC_CHECK_SHARED"] = "1" if check_shared else "0"
+
+    return replay
@@ -0,0 +1,213 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import gc
+import threading
+import weakref
+
+from pytest_mimic import encoding
+from pytest_mimic.encoding import canonical_encode
+from pytest_mimic.mimic_manager import compute_hash
+
+
+class Color(enum.Enum):
+    RED = 1
+    BLUE = 2
+
+
+@dataclasses.dataclass
+class Point:
+    x: float
+    y: float
+    tags: set
+
+
+def dummy_func(*args, **kwargs):
+    return args, kwargs
+
+
+def test_unordered_collections():
+    first = {"b": 2, "a": 1}
+    second = {"a": 1, "b": 2}
+    assert canonical_encode(first) == canonical_encode(second)
+
+    # Sets of strings iterate in a different order with another hash seed, which
+    # is simulated by building them in a different order
+    items = [f"item_{i}" for i in range(100)]
+    reversed_items = items[::-1]
+    assert canonical_encode(set(items)) == canonical_encode(set(reversed_items))
+    assert canonical_encode(frozenset(items)) == canonical_encode(frozenset(reversed_items))
+
+    assert compute_hash(dummy_func, ({"x", "y"},), {"b": 1, "a": 2}) == compute_hash(
+        dummy_func, ({"y", "x"},), {"a": 2, "b": 1}
+    )
+
+
+def test_shared_references():
+    # Pickle encodes the second occurrence of the same object as a memo reference
+    name = "".join(["na", "me"])
+    assert canonical_encode([name, name]) == canonical_encode(["name", "".join(["na", "me"])])
+
+
+def test_distinct_values():
+    values = [
+        None,
+        True,
+        False,
+        0,
+        1,
+        1.0,
+        "1",
+        b"1",
+        bytearray(b"1"),
+        [1],
+        (1,),
+        {1},
+        frozenset([1]),
+        {1: None},
+        [1, "a"],
+        [[1], ["a"]],
+        ["a", "b"],
+        ["ab"],
+        [2**70],
+        Color.RED,
+        Color.BLUE,
+        Point(1.0, 2.0, set()),
+        Point(2.0, 1.0, set()),
+        decimal.Decimal("1.0"),
+        datetime.date(2024, 1, 1),
+        datetime.datetime(2024, 1, 1),
+        datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        datetime.timedelta(days=1),
+    ]
+    encodings = [canonical_encode(value) for value in values]
+    assert len(set(encodings)) == len(values)
+
+    # Arguments are not ambiguous either
+    assert compute_hash(dummy_func, ("a", "b"), {}) != compute_hash(dummy_func, ("ab",), {})
+    assert compute_hash(dummy_func, ("a",), {}) != compute_hash(dummy_func, (), {"a": "a"})
+
+
+def test_records():
+    records = [{"id": i, "name": f"user{i}", "tags": ["a", {"b", "c"}]} for i in range(20)]
+    reordered = [{"tags": ["a", {"c", "b"}], "name": f"user{i}", "id": i} for i in range(20)]
+    assert canonical_encode(records) == canonical_encode(reordered)
+    # Encoded as columns unless the dicts have the same keys
+    assert canonical_encode(records) == canonical_encode(records[:10] + reordered[10:])
+    assert canonical_encode(records) != canonical_encode(records[:-1] + [{"id": 19}])
+    assert canonical_encode(records) != canonical_encode(tuple(records))
+    assert canonical_encode({"records": records}) == canonical_encode({"records": reordered})
+
+    # Sequences of sequences of primitives are kept as they are
+    rows = [[i, str(i)] for i in range(20)]
+    assert canonical_encode(rows) != canonical_encode([tuple(row) for row in rows])
+
+    # Records referencing themselves
+    cyclic = [{"id": i} for i in range(20)]
+    cyclic[0]["self"] = cyclic[0]
+    assert canonical_encode(cyclic) == canonical_encode(cyclic)
+
+
+def test_dataclasses_and_enums():
+    first = Point(1.0, 2.0, {"a", "b"})
+    second = Point(1.0, 2.0, {"b", "a"})
+    assert canonical_encode(first) == canonical_encode(second)
+    assert canonical_encode([Color.RED]) == canonical_encode([Color(1)])
+
+
+def test_cycles():
+    first = [1, 2]
+    first.append(first)
+    second = [1, 2]
+    second.append(second)
+    assert canonical_encode(first) == canonical_encode(second)
+
+    other = [1, 3]
+    other.append(other)
+    assert canonical_encode(first) != canonical_encode(other)
+
+
+def test_fallbacks():
+    # Pickled when there is no canonical encoding
+    assert canonical_encode(Exception("a")) == canonical_encode(Exception("a"))
+    assert canonical_encode(Exception("a")) != canonical_encode(Exception("b"))
+
+    # Objects that cannot be pickled are encoded with their string representation
+    lock = threading.Lock()
+    assert canonical_encode(lock) == canonical_encode(lock)
+    assert canonical_encode({"lock": lock, "tags": {"a", "b"}}) == canonical_encode(
+        {"tags": {"b", "a"}, "lock": lock}
+    )
+
+
+def test_large_values():
+    data = bytes(range(256)) * 4096
+    assert canonical_encode(data) == canonical_encode(bytes(data))
+
+    floats = [i / 3 for i in range(100_000)]
+    assert canonical_encode(floats) == canonical_encode(list(floats))
+    assert canonical_encode(floats) != canonical_encode(floats[:-1] + [0.0])
+
+
+class Document:
+    __mimic_version__ = 0
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def add(self, row):
+        self.rows.append(row)
+        self.__mimic_version__ += 1
+
+
+class Frame:
+    def __init__(self, name):
+        self.name = name
+
+    def __mimic_digest__(self):
+        return self.name
+
+
+def test_memoized_digests(monkeypatch):
+    data = bytes(range(256)) * 1024
+    items = tuple(range(5000))
+    encoded = canonical_encode([data, items])
+    assert canonical_encode([bytes(data), tuple(items)]) == encoded
+    assert canonical_encode([data[:-1] + b"\0", items]) != encoded
+
+    # The digests of the same objects are reused instead of encoding them again
+    calls = []
+    dumps = encoding._dumps
+    monkeypatch.setattr(encoding, "_dumps", lambda obj: calls.append(obj) or dumps(obj))
+    assert canonical_encode([data, items]) == encoded
+    assert len(calls) == 1
+
+    encoding.release_digests()
+    assert canonical_encode([data, items]) == encoded
+    assert len(calls) == 3
+
+
+def test_versioned_digests():
+    document = Document([{"id": 1}])
+    encoded = canonical_encode(document)
+    assert canonical_encode(Document([{"id": 1}])) == encoded
+
+    document.rows[0]["id"] = 2
+    # Mutating the object without changing its version reuses the memoized digest
+    assert canonical_encode(document) == encoded
+    document.add({"id": 3})
+    assert canonical_encode(document) != encoded
+    other = Document([{"id": 2}])
+    other.add({"id": 3})
+    assert canonical_encode(document) == canonical_encode(other)
+
+    # The memo doesn't keep objects alive
+    document_ref = weakref.ref(document)
+    del document, other
+    gc.collect()
+    assert document_ref() is None
+    assert not any(ref() is not None for ref, _, _ in encoding._versioned_digests.values())
+
+    assert canonical_encode(Frame("a")) == canonical_encode(Frame("a"))
+    assert canonical_encode(Frame("a")) != canonical_encode(Frame("b"))
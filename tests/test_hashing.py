@@ -0,0 +1,336 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import pytest
+
+from pytest_mimic.encoding import DIGEST_MIN_BYTES
+from pytest_mimic.mimic_manager import (
+    _accessed_hashes,
+    check_vault_metadata,
+    compute_hash,
+    finish_hash_migration,
+    get_recorded_hashes,
+    mimic,
+    refresh_vault_index,
+    set_hash_algorithm,
+    write_usage_ledger,
+)
+
+
+def sync_dummy_func(a, b=2):
+    return {"result": a + b}
+
+
+def test_hash_algorithms():
+    sha256_hash = compute_hash(sync_dummy_func, (5,), {"b": 3})
+    blake2b_hash = compute_hash(sync_dummy_func, (5,), {"b": 3}, algorithm="blake2b")
+
+    assert len(sha256_hash) == 64
+    assert blake2b_hash.startswith("blake2b-")
+    assert blake2b_hash != f"blake2b-{sha256_hash}"
+
+    set_hash_algorithm("blake2b")
+    assert compute_hash(sync_dummy_func, (5,), {"b": 3}) == blake2b_hash
+
+    with pytest.raises(ValueError, match="Unknown mimic hash algorithm 'md5'"):
+        set_hash_algorithm("md5")
+
+
+def test_xxh3():
+    pytest.importorskip("xxhash")
+    assert compute_hash(sync_dummy_func, (5,), {}, algorithm="xxh3").startswith("xxh3-")
+
+
+def test_vault_metadata(tmp_mimic_vault):
+    set_hash_algorithm("blake2b")
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+
+    metadata = json.loads((tmp_mimic_vault / "mimic.json").read_text())
+    assert metadata == {"version": 1, "hash_algorithm": "blake2b", "key_encoding": 3}
+    assert all(path.name.startswith("blake2b-") for path in tmp_mimic_vault.glob("blobs/*"))
+    check_vault_metadata()
+
+    set_hash_algorithm("sha256")
+    with pytest.raises(RuntimeError, match="keyed with blake2b, but the configured hash algorithm"):
+        check_vault_metadata()
+
+
+def test_key_encoding(tmp_mimic_vault):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+
+    # Recorded by versions of pytest-mimic encoding the arguments differently
+    metadata_file = tmp_mimic_vault / "mimic.json"
+    metadata_file.write_text(json.dumps({"version": 1, "hash_algorithm": "sha256"}))
+    with pytest.raises(RuntimeError, match="1 recordings keyed with version 1 of the encoding"):
+        check_vault_metadata()
+    metadata_file.write_text(
+        json.dumps({"version": 1, "hash_algorithm": "sha256", "key_encoding": 4})
+    )
+    with pytest.raises(RuntimeError, match="Upgrade pytest-mimic"):
+        check_vault_metadata(migrate=True)
+
+    # Empty vaults get the current encoding
+    for path in tmp_mimic_vault.glob("*.ref"):
+        path.unlink()
+    refresh_vault_index()
+    check_vault_metadata()
+    assert json.loads(metadata_file.read_text())["key_encoding"] == 3
+
+
+def test_legacy_key_encodings():
+    # Version 1 pickled each argument
+    hasher = hashlib.sha256()
+    hasher.update(f"{__name__}.sync_dummy_func".encode())
+    hasher.update(inspect.getsource(sync_dummy_func).encode())
+    for part in (pickle.dumps(5), b"b", pickle.dumps(3)):
+        hasher.update(part)
+    assert compute_hash(sync_dummy_func, (5,), {"b": 3}, key_encoding=1) == hasher.hexdigest()
+
+    # Version 2 didn't encode large arguments by their digest
+    assert compute_hash(sync_dummy_func, (5,), {"b": 3}, key_encoding=2) == compute_hash(
+        sync_dummy_func, (5,), {"b": 3}
+    )
+    large = bytes(DIGEST_MIN_BYTES)
+    assert compute_hash(sync_dummy_func, (large,), {}, key_encoding=2) != compute_hash(
+        sync_dummy_func, (large,), {}
+    )
+
+
+def test_key_encoding_migration(tmp_mimic_vault):
+    # Recorded before the encoding was versioned, with the results pickled directly
+    old_hash_keys = {}
+    for b in (3, 4):
+        old_hash_keys[b] = compute_hash(sync_dummy_func, (5,), {"b": b}, key_encoding=1)
+        (tmp_mimic_vault / f"{old_hash_keys[b]}.pkl").write_bytes(pickle.dumps({"result": 5 + b}))
+    refresh_vault_index()
+    with pytest.raises(RuntimeError, match="2 recordings keyed with version 1 of the encoding"):
+        check_vault_metadata()
+
+    check_vault_metadata(migrate=True)
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=3) == {"result": 8}
+
+    # The recording that wasn't replayed is still listed as keyed with version 1
+    assert finish_hash_migration() == (1, 1)
+    metadata = json.loads((tmp_mimic_vault / "mimic.json").read_text())
+    assert metadata["key_encoding"] == 3
+    assert metadata["legacy_hashes"] == {"1": [old_hash_keys[4]]}
+    with pytest.raises(RuntimeError, match="1 recordings keyed with version 1 of the encoding"):
+        check_vault_metadata()
+
+    check_vault_metadata(migrate=True)
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=4) == {"result": 9}
+    assert finish_hash_migration() == (1, 0)
+    check_vault_metadata()
+    assert "legacy_hashes" not in json.loads((tmp_mimic_vault / "mimic.json").read_text())
+    assert get_recorded_hashes() == {
+        compute_hash(sync_dummy_func, (5,), {"b": 3}),
+        compute_hash(sync_dummy_func, (5,), {"b": 4}),
+    }
+
+
+def test_mixed_algorithms(tmp_mimic_vault):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+
+    # Recordings keyed with another algorithm than the one of the metadata
+    set_hash_algorithm("blake2b")
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=4)
+
+    with pytest.raises(RuntimeError, match="keyed with blake2b, sha256"):
+        check_vault_metadata()
+
+    # Such a vault can still be migrated
+    check_vault_metadata(migrate=True)
+
+
+def test_migration(tmp_mimic_vault):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+        sync_dummy_func(5, b=4)
+
+    set_hash_algorithm("blake2b")
+    check_vault_metadata(migrate=True)
+
+    os.environ["MIMIC_RECORD"] = "0"
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=3) == {"result": 8}
+
+    # The recording that wasn't replayed cannot be migrated, but is kept
+    assert finish_hash_migration() == (1, 1)
+    assert get_recorded_hashes() == {
+        compute_hash(sync_dummy_func, (5,), {"b": 3}),
+        compute_hash(sync_dummy_func, (5,), {"b": 4}, algorithm="sha256"),
+    }
+    assert json.loads((tmp_mimic_vault / "mimic.json").read_text())["hash_algorithm"] == "blake2b"
+    with pytest.raises(RuntimeError, match="keyed with blake2b, sha256"):
+        check_vault_metadata()
+
+    # Until it's replayed by another run
+    check_vault_metadata(migrate=True)
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=4) == {"result": 9}
+    assert finish_hash_migration() == (1, 0)
+    check_vault_metadata()
+
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=3) == {"result": 8}
+
+    # The blobs were rewritten under their new digest
+    blob_names = [path.name for path in tmp_mimic_vault.glob("blobs/*")]
+    assert len(blob_names) == 2
+    assert all(name.startswith("blake2b-") for name in blob_names)
+
+
+def test_migration_by_xdist_workers(tmp_mimic_vault):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_hashing.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+
+    # A worker migrates the recording, and reports it to the controller
+    set_hash_algorithm("blake2b")
+    check_vault_metadata(migrate=True)
+    _accessed_hashes.clear()
+    os.environ["MIMIC_RECORD"] = "0"
+    with mimic("test_hashing.sync_dummy_func"):
+        assert sync_dummy_func(5, b=3) == {"result": 8}
+    write_usage_ledger(run_id="run1")
+
+    # The controller didn't replay anything itself
+    set_hash_algorithm("blake2b")
+    check_vault_metadata(migrate=True)
+    _accessed_hashes.clear()
+    assert finish_hash_migration(run_id="run1") == (1, 0)
+    assert get_recorded_hashes() == {compute_hash(sync_dummy_func, (5,), {"b": 3})}
+    check_vault_metadata()
+
+
+def test_migrate_command(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            test_migrate.slow_function
+    """)
+    pytester.makepyfile(
+        test_migrate="""
+        def slow_function(a):
+            return a * 2
+
+        def test_slow_function():
+            assert slow_function(2) == 4
+        """
+    )
+    results = pytester.runpytest("--mimic-record")
+    assert results.parseoutcomes()["passed"] == 1
+    os.environ["MIMIC_RECORD"] = "0"
+
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_hash_algorithm = blake2b
+        mimic_functions =
+            test_migrate.slow_function
+    """)
+    results = pytester.runpytest()
+    assert results.ret == pytest.ExitCode.USAGE_ERROR
+    assert "INTERNALERROR" not in "\n".join(results.outlines + results.errlines)
+    results.stderr.fnmatch_lines(
+        [
+            "ERROR: Mimic vault * holds recordings keyed with sha256*",
+            "Run pytest with --mimic-migrate-hash*",
+        ]
+    )
+
+    results = pytester.runpytest("--mimic-migrate-hash")
+    assert results.parseoutcomes()["passed"] == 1
+
+    results = pytester.runpytest("--mimic-fail-on-unused")
+    assert results.parseoutcomes()["passed"] == 1
+    assert all(
+        path.name.startswith("blake2b-") for path in pytester.path.glob(".mimic_vault/*.ref")
+    )
+
+
+def test_generator_only_vault(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_hash_algorithm = blake2b
+        mimic_functions =
+            test_pages.fetch_pages
+    """)
+    pytester.makepyfile(
+        test_pages="""
+        def fetch_pages(n):
+            yield from range(n)
+
+        def test_fetch_pages():
+            assert list(fetch_pages(3)) == [0, 1, 2]
+        """
+    )
+    results = pytester.runpytest("--mimic-record")
+    assert results.parseoutcomes()["passed"] == 1
+    os.environ["MIMIC_RECORD"] = "0"
+
+    metadata = json.loads((pytester.path / ".mimic_vault" / "mimic.json").read_text())
+    assert metadata["hash_algorithm"] == "blake2b"
+    results = pytester.runpytest()
+    assert results.parseoutcomes()["passed"] == 1
+
+
+def test_clear_unmigrated_recordings(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            test_migrate.slow_function
+    """)
+    pytester.makepyfile(
+        test_migrate="""
+        def slow_function(a):
+            return a * 2
+
+        def test_kept():
+            assert slow_function(2) == 4
+
+        def test_removed():
+            assert slow_function(3) == 6
+        """
+    )
+    results = pytester.runpytest("--mimic-record")
+    assert results.parseoutcomes()["passed"] == 2
+    os.environ["MIMIC_RECORD"] = "0"
+
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_hash_algorithm = blake2b
+        mimic_functions =
+            test_migrate.slow_function
+    """)
+    results = pytester.runpytest("--mimic-migrate-hash", "-k", "test_kept")
+    assert results.parseoutcomes()["passed"] == 1
+
+    # The recording that wasn't migrated fails the vault check, even when clearing
+    results = pytester.runpytest("--mimic-clear-unused", "-k", "test_kept")
+    assert results.ret == pytest.ExitCode.USAGE_ERROR
+
+    # Forget the hashes accessed by the previous in-process runs
+    _accessed_hashes.clear()
+    results = pytester.runpytest("--mimic-migrate-hash", "--mimic-clear-unused", "-k", "test_kept")
+    assert results.parseoutcomes()["passed"] == 1
+    results = pytester.runpytest("-k", "test_kept")
+    assert results.parseoutcomes()["passed"] == 1
+    assert len(list(pytester.path.glob(".mimic_vault/*.ref"))) == 1
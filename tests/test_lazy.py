@@ -0,0 +1,132 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from pytest_mimic import mimic_manager, resolve_lazy
+from pytest_mimic.lazy import LazyResult, is_loaded
+from pytest_mimic.mimic_manager import mimic
+
+
+class Payload:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def total(self):
+        return sum(self.rows)
+
+
+def sync_dummy_func(a):
+    return {"rows": list(range(a))}
+
+
+async def async_dummy_func(a):
+    return Payload(list(range(a)))
+
+
+def scalar_dummy_func(a):
+    return a * 2
+
+
+def summarize_dummy_func(data):
+    return {"total": sum(data["rows"])}
+
+
+def failing_dummy_func(a):
+    raise ValueError(f"Invalid value {a}")
+
+
+def dummy_generator(a):
+    yield a
+
+
+def test_lazy_result(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_lazy.sync_dummy_func", lazy=True):
+        recorded = sync_dummy_func(3)
+    assert type(recorded) is dict
+
+    replay_from_disk()
+    with mimic("test_lazy.sync_dummy_func", lazy=True):
+        result = sync_dummy_func(3)
+        unused_result = sync_dummy_func(3)
+
+    assert type(result) is LazyResult
+    assert not is_loaded(result)
+    assert len(mimic_manager._blob_cache) == 0
+
+    assert result["rows"] == [0, 1, 2]
+    assert is_loaded(result)
+    assert isinstance(result, dict)
+    assert result == recorded
+    assert len(result) == 1
+    assert type(resolve_lazy(result)) is dict
+
+    # Each call still gets its own copy
+    assert not is_loaded(unused_result)
+    result["rows"].append(3)
+    assert unused_result["rows"] == [0, 1, 2]
+
+    # A proxy pickles as the result itself
+    assert type(pickle.loads(pickle.dumps(result))) is dict
+
+
+def test_lazy_argument(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_lazy.sync_dummy_func", lazy=True), mimic("test_lazy.summarize_dummy_func"):
+        assert summarize_dummy_func(sync_dummy_func(4)) == {"total": 6}
+
+    # A lazy result passed to another mimicked function is hashed like the result itself
+    replay_from_disk()
+    with mimic("test_lazy.sync_dummy_func", lazy=True), mimic("test_lazy.summarize_dummy_func"):
+        data = sync_dummy_func(4)
+        assert type(data) is LazyResult
+        assert summarize_dummy_func(data) == {"total": 6}
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_result(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_lazy.async_dummy_func", lazy=True):
+        await async_dummy_func(4)
+
+    replay_from_disk()
+    with mimic("test_lazy.async_dummy_func", lazy=True):
+        result = await async_dummy_func(4)
+
+    assert not is_loaded(result)
+    assert result.total() == 6
+    assert isinstance(result, Payload)
+
+
+def test_eager_fallback(tmp_mimic_vault, replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_lazy.scalar_dummy_func", lazy=True):
+        scalar_dummy_func(2)
+    with mimic("test_lazy.failing_dummy_func", lazy=True, record_exceptions=True):
+        with pytest.raises(ValueError, match="Invalid value 2"):
+            failing_dummy_func(2)
+    with mimic("test_lazy.sync_dummy_func", lazy=True):
+        sync_dummy_func(2)
+
+    # Recording made before the type of results was recorded
+    for ref_file in tmp_mimic_vault.glob("*.ref"):
+        ref = json.loads(ref_file.read_text())
+        if ref["type"] == "builtins.dict":
+            ref_file.write_text(json.dumps({"digest": ref["digest"]}))
+
+    replay_from_disk()
+    with mimic("test_lazy.scalar_dummy_func", lazy=True):
+        assert type(scalar_dummy_func(2)) is int
+    with mimic("test_lazy.failing_dummy_func", lazy=True, record_exceptions=True):
+        with pytest.raises(ValueError, match="Invalid value 2"):
+            failing_dummy_func(2)
+    with mimic("test_lazy.sync_dummy_func", lazy=True):
+        assert type(sync_dummy_func(2)) is dict
+
+
+def test_lazy_generator():
+    with pytest.raises(ValueError, match="Lazy results are not supported"):
+        with mimic("test_lazy.dummy_generator", lazy=True):
+            pass
@@ -57,3 +57,28 @@ def test_mimic_across_runs(pytester):
 
     # Both tests should pass with replay
     assert results.parseoutcomes()["passed"] == 2
+
+
+def test_mimic_fixture_scope(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_fixture_scope = module
+    """)
+    pytester.makepyfile(
+        test_fixture_scope="""
+        import os
+
+        def func_to_mimic(a, b):
+            return {"result": a + b}
+
+        def test_first(mimic):
+            mimic("test_fixture_scope.func_to_mimic")
+            assert func_to_mimic(5, b=3) == {"result": 8}
+
+        def test_still_active():
+            assert hasattr(func_to_mimic, "__wrapped__")
+        """
+    )
+    results = pytester.runpytest("--mimic-record", "-v")
+    assert results.parseoutcomes()["passed"] == 2
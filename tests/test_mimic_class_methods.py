@@ -62,6 +62,23 @@ def test_mimic_mutable_method():
             ExampleClass().example_mutable_method(5, b=3)
 
 
+def test_mimic_restores_static_and_class_methods():
+    original_staticmethod = ExampleClass.__dict__["example_staticmethod"]
+    original_classmethod = ExampleClass.__dict__["example_classmethod"]
+    os.environ["MIMIC_RECORD"] = "1"
+
+    with mimic("tests.example_module.ExampleClass.example_staticmethod"):
+        with mimic(
+            "tests.example_module.ExampleClass.example_classmethod", classmethod_warning=False
+        ):
+            # Mimicked methods can still be called on instances
+            assert ExampleClass().example_staticmethod(5, b=3) == 8
+            assert ExampleClass().example_classmethod(5, b=3) == 8
+
+    assert ExampleClass.__dict__["example_staticmethod"] is original_staticmethod
+    assert ExampleClass.__dict__["example_classmethod"] is original_classmethod
+
+
 def test_mimic_nested_classmethod():
     with pytest.warns(UserWarning):
         with mimic(
@@ -20,3 +20,123 @@ async def test_mimicking_at_global_level():
     res_mimicked = await example_function_to_mimic(1, 2)
 
     assert res_recording == res_mimicked
+
+
+def test_global_targets_installed_on_import(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            heavy_module.slow_function
+            heavy_module.HeavyClass.slow_method
+    """)
+    pytester.makepyfile(
+        heavy_module="""
+        def slow_function(a):
+            return a * 2
+
+        class HeavyClass:
+            def slow_method(self, a):
+                return a * 3
+        """,
+        test_lazy_install="""
+        import sys
+
+        def test_not_imported_at_startup():
+            assert "heavy_module" not in sys.modules
+
+        def test_installed_on_import():
+            import heavy_module
+            from heavy_module import slow_function
+
+            assert hasattr(slow_function, "__wrapped__")
+            assert hasattr(heavy_module.HeavyClass.slow_method, "__wrapped__")
+            assert slow_function(2) == 4
+            assert heavy_module.HeavyClass().slow_method(2) == 6
+        """,
+    )
+    results = pytester.runpytest("--mimic-record", "-v")
+    assert results.parseoutcomes()["passed"] == 2
+
+
+def test_global_target_with_unknown_package(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            not_an_existing_package.function
+    """)
+    pytester.makepyfile("def test_nothing(): pass")
+    results = pytester.runpytest()
+    output = "\n".join(results.outlines + results.errlines)
+    assert "Failed to import function from path 'not_an_existing_package.function'" in output
+
+
+def test_global_target_with_misspelled_name(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            heavy_package.heavy_module.slwo_function
+    """)
+    pytester.makepyfile(
+        **{
+            "heavy_package/__init__": "",
+            "heavy_package/heavy_module": """
+            def slow_function(a):
+                return a * 2
+            """,
+            "test_misspelled": """
+            import sys
+
+            def test_not_imported_at_startup():
+                assert "heavy_package" not in sys.modules
+
+            def test_import():
+                import heavy_package.heavy_module
+
+            def test_optional_import():
+                try:
+                    import heavy_package.heavy_module
+                except ImportError:
+                    pass
+            """,
+        }
+    )
+    results = pytester.runpytest()
+    output = "\n".join(results.outlines + results.errlines)
+    assert results.parseoutcomes()["failed"] == 1
+    assert (
+        "Failed to import function from path 'heavy_package.heavy_module.slwo_function'" in output
+    )
+    # The failure is reported at the end of the session even if the import error is swallowed
+    results = pytester.runpytest("-k", "test_optional_import")
+    output = "\n".join(results.outlines + results.errlines)
+    assert results.parseoutcomes()["passed"] == 1
+    assert "heavy_package.heavy_module.slwo_function" in output
+
+
+def test_global_target_with_misspelled_module(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            heavy_package.heavy_modul.slow_function
+    """)
+    pytester.makepyfile(
+        **{
+            "heavy_package/__init__": "",
+            "heavy_package/heavy_module": """
+            def slow_function(a):
+                return a * 2
+            """,
+            "test_misspelled": """
+            def test_import():
+                import heavy_package
+            """,
+        }
+    )
+    results = pytester.runpytest()
+    output = "\n".join(results.outlines + results.errlines)
+    assert results.parseoutcomes()["failed"] == 1
+    assert "Failed to import function from path 'heavy_package.heavy_modul.slow_function'" in output
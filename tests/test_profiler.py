@@ -0,0 +1,111 @@
+import threading
+import time
+
+from pytest_mimic.profiler import MimicProfiler, format_report
+
+
+def test_profile_suggests_functions(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_profile_modules =
+            pricing
+    """)
+    pytester.makepyfile(
+        storage="""
+        import time
+        from pathlib import Path
+
+        def load_report(path):
+            time.sleep(0.2)
+            return Path(path).read_text()
+
+        def format_name(name):
+            return name.title()
+        """,
+        pricing="""
+        import time
+
+        def compute_price(quantity):
+            time.sleep(0.02)
+            return quantity * 2
+
+        def apply_discounts(prices):
+            prices.append(0)
+            return sum(prices)
+        """,
+        test_profiled="""
+        import pricing
+        import storage
+
+        def test_storage(tmp_path):
+            path = tmp_path / "report.txt"
+            path.write_text("report")
+            assert storage.load_report(str(path)) == "report"
+            assert storage.format_name("alice") == "Alice"
+
+        def test_pricing():
+            assert pricing.compute_price(2) == 4
+            assert pricing.compute_price(3) == 6
+            assert pricing.apply_discounts([1, 2]) == 3
+        """,
+    )
+    results = pytester.runpytest("--mimic-profile")
+    assert results.parseoutcomes()["passed"] == 2
+
+    output = results.stdout.str()
+    assert "mimic profile" in output
+    report = output.split("Suggested configuration:")[1]
+    # Ranked by time saved: a project function doing disk I/O and a function of a profiled module
+    assert report.index("storage.load_report") < report.index("pricing.compute_price")
+    # Neither pure project code nor functions mutating their inputs are suggested
+    assert "storage.format_name" not in output
+    assert "pricing.apply_discounts" not in report
+    results.stdout.fnmatch_lines(["*disk*storage.load_report", "*mutates inputs*apply_discounts"])
+
+
+def test_profile_calls(tmp_path):
+    def slow(value):
+        time.sleep(0.01)
+        return value
+
+    def unpicklable():
+        return threading.Lock()
+
+    profiler = MimicProfiler(tmp_path, module_prefixes=[__name__])
+    profiler.start()
+    try:
+        for value in range(3):
+            slow(value)
+        unpicklable()
+    finally:
+        profiler.stop()
+
+    # Nested functions cannot be mimicked, so they aren't profiled
+    assert profiler.candidates() == []
+    assert format_report([]) == ["No candidate function found."]
+
+    profiler = MimicProfiler(tmp_path, module_prefixes=[__name__])
+    profiler.start()
+    try:
+        for value in range(3):
+            _slow(value)
+        _unpicklable()
+    finally:
+        profiler.stop()
+
+    candidates = {candidate.target: candidate for candidate in profiler.candidates()}
+    slow_candidate = candidates[f"{__name__}._slow"]
+    assert slow_candidate.calls == 3
+    assert slow_candidate.total_time >= 0.03
+    assert slow_candidate.mimickable
+    assert not candidates[f"{__name__}._unpicklable"].picklable
+
+
+def _slow(value):
+    time.sleep(0.01)
+    return value
+
+
+def _unpicklable():
+    return threading.Lock()
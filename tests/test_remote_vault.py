@@ -0,0 +1,191 @@
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from pytest_mimic import mimic_manager
+from pytest_mimic.mimic_manager import (
+    flush_remote_uploads,
+    mimic,
+    prefetch_remote_vault,
+    set_remote_vault,
+)
+from pytest_mimic.remote_vault import RemoteVault
+
+
+def sync_dummy_func(a, b=2):
+    return {"result": a + b}
+
+
+class _VaultRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for an object store, keeping files in memory."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        self.server.requests.append(("GET", self.path))
+        key = unquote(self.path[len("/vault/") :])
+        if not key:
+            self._respond(200, "\n".join(sorted(self.server.files)).encode())
+        elif key in self.server.files:
+            self._respond(200, self.server.files[key])
+        else:
+            self._respond(404, b"")
+
+    def do_PUT(self):  # noqa: N802
+        self.server.requests.append(("PUT", self.path))
+        key = unquote(self.path[len("/vault/") :])
+        self.server.files[key] = self.rfile.read(int(self.headers["Content-Length"]))
+        self._respond(201, b"")
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def remote_vault_server():
+    """Run a local stand-in for a remote vault, and configure mimic to use it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _VaultRequestHandler)
+    server.files = {}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+
+    set_remote_vault(RemoteVault(f"http://127.0.0.1:{server.server_port}/vault"))
+    yield server
+
+    set_remote_vault(None)
+    server.shutdown()
+    server.server_close()
+
+
+def test_recordings_uploaded_in_batch(remote_vault_server, tmp_mimic_vault):
+    os.environ["MIMIC_RECORD"] = "1"
+
+    with mimic("test_remote_vault.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+        sync_dummy_func(3, b=5)
+
+    # Nothing is uploaded until the end of the session
+    assert remote_vault_server.files == {}
+
+    # Two references, the shared blob and the vault metadata
+    assert flush_remote_uploads() == 4
+    assert sorted(key.split("/")[0] for key in remote_vault_server.files) == sorted(
+        [path.name for path in tmp_mimic_vault.glob("*.ref")] + ["blobs", "mimic.json"]
+    )
+    assert flush_remote_uploads() == 0
+
+
+def test_read_through(remote_vault_server, tmp_mimic_vault, tmp_path):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_remote_vault.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+    flush_remote_uploads()
+
+    # Replay from another (empty) local vault
+    mimic_manager.set_cache_dir(tmp_path / "other_vault")
+    os.environ["MIMIC_RECORD"] = "0"
+    with mimic("test_remote_vault.sync_dummy_func"):
+        assert sync_dummy_func(5, b=3) == {"result": 8}
+        with pytest.raises(RuntimeError, match="Missing mimic-recorded result"):
+            sync_dummy_func(1, b=1)
+
+    assert len(list((tmp_path / "other_vault").glob("*.ref"))) == 1
+
+
+def test_prefetch(remote_vault_server, tmp_path):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_remote_vault.sync_dummy_func"):
+        sync_dummy_func(5, b=3)
+        sync_dummy_func(5, b=4)
+    flush_remote_uploads()
+
+    mimic_manager.set_cache_dir(tmp_path / "other_vault")
+    remote_vault_server.requests.clear()
+
+    assert prefetch_remote_vault() == 5
+    assert prefetch_remote_vault() == 0
+
+    # Replaying doesn't need the remote vault anymore
+    remote_vault_server.requests.clear()
+    os.environ["MIMIC_RECORD"] = "0"
+    with mimic("test_remote_vault.sync_dummy_func"):
+        assert sync_dummy_func(5, b=4) == {"result": 9}
+    assert remote_vault_server.requests == []
+
+
+def test_invalid_remote_vault_url():
+    with pytest.raises(ValueError, match="Invalid remote mimic vault URL"):
+        RemoteVault("ftp://example.com/vault")
+
+
+@pytest.fixture
+def unreachable_vault_url():
+    """Get the URL of a remote vault whose server is down."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Nothing listens on the port once the socket is closed
+    return f"http://127.0.0.1:{port}/vault"
+
+
+def test_remote_vault_down(unreachable_vault_url, tmp_mimic_vault, caplog):
+    set_remote_vault(RemoteVault(unreachable_vault_url, timeout=1))
+    try:
+        assert prefetch_remote_vault() == 0
+
+        # Misses are reported as missing in replay mode, and recorded in record mode
+        with mimic("test_remote_vault.sync_dummy_func"):
+            with pytest.raises(RuntimeError, match="Missing mimic-recorded result"):
+                sync_dummy_func(5, b=3)
+            os.environ["MIMIC_RECORD"] = "1"
+            assert sync_dummy_func(5, b=3) == {"result": 8}
+            os.environ["MIMIC_RECORD"] = "0"
+            assert sync_dummy_func(5, b=3) == {"result": 8}
+
+        with pytest.raises(ConnectionRefusedError):
+            flush_remote_uploads()
+    finally:
+        set_remote_vault(None)
+
+    assert "failed to prefetch remote vault" in caplog.text
+    assert "only using the local vault" in caplog.text
+
+
+def test_remote_vault_down_plugin(pytester, unreachable_vault_url):
+    pytester.makeini(f"""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_remote_vault = {unreachable_vault_url}
+        mimic_remote_prefetch = true
+        mimic_functions =
+            api.fetch_user
+    """)
+    pytester.makepyfile(
+        api="""
+        def fetch_user(user_id):
+            return {"id": user_id}
+        """,
+        test_api="""
+        import api
+
+        def test_user():
+            assert api.fetch_user(1) == {"id": 1}
+        """,
+    )
+    results = pytester.runpytest("--mimic-record")
+    os.environ["MIMIC_RECORD"] = "0"
+    assert results.parseoutcomes()["passed"] == 1
+
+    results = pytester.runpytest()
+    assert results.parseoutcomes()["passed"] == 1
@@ -0,0 +1,171 @@
+import json
+import os
+
+import pytest
+
+from pytest_mimic import mimic_manager
+from pytest_mimic.mimic_manager import compute_hash, get_blob_path, get_ref_path, mimic
+from pytest_mimic.serializers import Serializer, get_serializer, register_serializer
+
+
+class UpperSerializer(Serializer):
+    name = "upper"
+
+    def can_serialize(self, obj):
+        return type(obj) is str and obj.islower()
+
+    def dumps(self, obj):
+        return obj.upper().encode()
+
+    def loads(self, data):
+        return data.decode().lower()
+
+
+class MissingSerializer(Serializer):
+    name = "missing"
+    requires = "pytest_mimic_missing_module"
+
+    def dumps(self, obj):
+        raise AssertionError("Not installed")
+
+    def loads(self, data):
+        raise AssertionError("Not installed")
+
+
+def fetch_payload(n):
+    return {"items": [{"id": i, "score": i / 3} for i in range(n)], "next": None}
+
+
+def fetch_pair(n):
+    return (n, n + 1)
+
+
+def fetch_name(name):
+    return name
+
+
+def dummy_generator(a):
+    yield a
+
+
+@pytest.fixture
+def type_serializers():
+    yield mimic_manager.set_type_serializers
+    mimic_manager.set_type_serializers({})
+
+
+def _ref(name, *args):
+    ref_file = get_ref_path(compute_hash(globals()[name], args, {}))
+    return json.loads(ref_file.read_bytes())
+
+
+def _record_and_replay(name, *args, **options):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic(f"test_serializers.{name}", **options):
+        # Looked up once mimicked
+        recorded = globals()[name](*args)
+
+    # Forget the blobs cached in memory while recording
+    mimic_manager.set_cache_dir(mimic_manager.get_cache_dir())
+    os.environ["MIMIC_RECORD"] = "0"
+    with mimic(f"test_serializers.{name}", **options):
+        replayed = globals()[name](*args)
+    return recorded, replayed
+
+
+def test_json_serializer():
+    recorded, replayed = _record_and_replay("fetch_payload", 3, serializer="json")
+    assert replayed == recorded
+
+    ref = _ref("fetch_payload", 3)
+    assert ref["serializer"] == "json"
+    assert json.loads(get_blob_path(ref["digest"]).read_bytes()) == recorded
+
+
+def test_unsupported_results_are_pickled(caplog):
+    # JSON would replay the tuple as a list
+    recorded, replayed = _record_and_replay("fetch_pair", 1, serializer="json")
+    assert replayed == recorded == (1, 2)
+    assert _ref("fetch_pair", 1)["serializer"] == "pickle"
+    assert "cannot be serialized with json" in caplog.text
+
+
+def test_type_serializers(type_serializers):
+    type_serializers({"builtins.dict": "json"})
+    recorded, replayed = _record_and_replay("fetch_payload", 2)
+    assert replayed == recorded
+    assert _ref("fetch_payload", 2)["serializer"] == "json"
+
+    _record_and_replay("fetch_pair", 2)
+    assert _ref("fetch_pair", 2)["serializer"] == "pickle"
+
+    with pytest.raises(ValueError, match="Unknown mimic serializer 'yaml'"):
+        type_serializers({"builtins.dict": "yaml"})
+
+
+def test_custom_serializer():
+    register_serializer(UpperSerializer())
+    recorded, replayed = _record_and_replay("fetch_name", "alice", serializer="upper", lazy=True)
+    assert replayed == recorded == "alice"
+    ref = _ref("fetch_name", "alice")
+    assert ref["serializer"] == "upper"
+    assert get_blob_path(ref["digest"]).read_bytes() == b"ALICE"
+
+    register_serializer(MissingSerializer())
+    with pytest.raises(ImportError, match="pip install pytest_mimic_missing_module"):
+        get_serializer("missing")
+    with pytest.raises(ImportError, match="requires the pytest_mimic_missing_module package"):
+        with mimic("test_serializers.fetch_name", serializer="missing"):
+            pass
+
+    with pytest.raises(ValueError, match="Serializers are not supported"):
+        with mimic("test_serializers.dummy_generator", serializer="json"):
+            pass
+
+
+def test_npy_serializer():
+    numpy = pytest.importorskip("numpy")
+    serializer = get_serializer("npy")
+    array = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+    assert serializer.can_serialize(array)
+    assert not serializer.can_serialize(numpy.array([{}], dtype=object))
+    assert numpy.array_equal(serializer.loads(serializer.dumps(array)), array)
+
+
+def test_arrow_serializer():
+    pyarrow = pytest.importorskip("pyarrow")
+    serializer = get_serializer("arrow")
+    table = pyarrow.table({"id": [1, 2], "name": ["a", "b"]})
+    assert serializer.can_serialize(table)
+    assert serializer.loads(serializer.dumps(table)).equals(table)
+
+
+def test_serializers_setting(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_serializers =
+            builtins.dict = json
+        mimic_functions =
+            api.fetch_user
+    """)
+    pytester.makepyfile(
+        api="""
+        def fetch_user(user_id):
+            return {"id": user_id, "tags": ["admin"]}
+        """,
+        test_api="""
+        import api
+
+        def test_user():
+            assert api.fetch_user(1) == {"id": 1, "tags": ["admin"]}
+        """,
+    )
+    results = pytester.runpytest("--mimic-record")
+    assert results.parseoutcomes()["passed"] == 1
+    os.environ["MIMIC_RECORD"] = "0"
+
+    refs = [json.loads(path.read_bytes()) for path in pytester.path.glob(".mimic_vault/*.ref")]
+    assert [ref["serializer"] for ref in refs] == ["json"]
+    results = pytester.runpytest()
+    assert results.parseoutcomes()["passed"] == 1
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from pytest_mimic.mimic_manager import check_shared_results, mimic
+
+
+def lookup_table(size):
+    return {"rows": list(range(size))}
+
+
+async def async_lookup_table(size):
+    return {"rows": list(range(size))}
+
+
+def failing_dummy_func(a):
+    raise ValueError(f"Invalid value {a}")
+
+
+def dummy_generator(a):
+    yield a
+
+
+def test_shared_result(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_shared_results.lookup_table", share_result=True):
+        lookup_table(3)
+        lookup_table(4)
+
+    replay_from_disk()
+    with mimic("test_shared_results.lookup_table", share_result=True):
+        first = lookup_table(3)
+        second = lookup_table(3)
+        other = lookup_table(4)
+    assert first is second
+    assert first == {"rows": [0, 1, 2]}
+    assert other is not first
+
+    # Without the option, every call still gets its own copy
+    with mimic("test_shared_results.lookup_table"):
+        assert lookup_table(3) is not first
+        assert lookup_table(3) is not lookup_table(3)
+
+    # Each session unpickles the results again
+    replay_from_disk()
+    with mimic("test_shared_results.lookup_table", share_result=True):
+        assert lookup_table(3) is not first
+
+
+@pytest.mark.asyncio
+async def test_shared_async_result(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_shared_results.async_lookup_table", share_result=True):
+        await async_lookup_table(3)
+
+    replay_from_disk()
+    with mimic("test_shared_results.async_lookup_table", share_result=True):
+        assert await async_lookup_table(3) is await async_lookup_table(3)
+
+
+def test_check_shared_results(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_shared_results.lookup_table", share_result=True):
+        lookup_table(3)
+        lookup_table(4)
+
+    replay_from_disk(check_shared=True)
+    with mimic("test_shared_results.lookup_table", share_result=True):
+        lookup_table(3)
+        assert check_shared_results() == []
+
+        lookup_table(4)["rows"].append(4)
+    assert check_shared_results() == ["test_shared_results.lookup_table"]
+
+
+def test_shared_exceptions_and_unsupported_functions(replay_from_disk):
+    os.environ["MIMIC_RECORD"] = "1"
+    with mimic("test_shared_results.failing_dummy_func", record_exceptions=True, share_result=True):
+        with pytest.raises(ValueError, match="Invalid value 2"):
+            failing_dummy_func(2)
+
+    # Recorded exceptions are raised again on every call
+    replay_from_disk()
+    with mimic("test_shared_results.failing_dummy_func", record_exceptions=True, share_result=True):
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Invalid value 2"):
+                failing_dummy_func(2)
+
+    with pytest.raises(ValueError, match="Shared results are not supported"):
+        with mimic("test_shared_results.dummy_generator", share_result=True):
+            pass
+    with pytest.raises(ValueError, match="both lazy=True and share_result=True"):
+        with mimic("test_shared_results.lookup_table", lazy=True, share_result=True):
+            pass
+
+
+def test_check_shared_option(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+    """)
+    pytester.makepyfile(
+        config_loader="""
+        def load_config(name):
+            return {"name": name, "features": ["a"]}
+        """,
+        test_shared="""
+        from pytest_mimic import mimic
+
+        import config_loader
+
+        def test_read():
+            with mimic("config_loader.load_config", share_result=True):
+                assert config_loader.load_config("app")["features"] == ["a"]
+
+        def test_mutate():
+            with mimic("config_loader.load_config", share_result=True):
+                config_loader.load_config("app")["features"].append("b")
+        """,
+    )
+    results = pytester.runpytest("--mimic-record")
+    assert results.parseoutcomes()["passed"] == 2
+    os.environ["MIMIC_RECORD"] = "0"
+
+    results = pytester.runpytest("--mimic-check-shared")
+    output = "\n".join(results.outlines + results.errlines)
+    assert "Shared mimic results were mutated by the tests: config_loader.load_config" in output
+
+    results = pytester.runpytest("--mimic-check-shared", "-k", "test_read")
+    assert results.ret == 0
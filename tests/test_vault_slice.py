@@ -0,0 +1,172 @@
+import io
+import os
+import shutil
+import tarfile
+
+import pytest
+
+from pytest_mimic.mimic_manager import stop_test_usage
+from pytest_mimic.vault_slice import import_vault_slice
+
+
+def test_export_and_import_slice(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            backend.load_table
+            backend.fetch_user
+    """)
+    pytester.makepyfile(
+        backend="""
+        def load_table(name):
+            return {"table": name}
+
+        def fetch_user(user_id):
+            return {"id": user_id}
+        """,
+        test_slice="""
+        import pytest
+
+        import backend
+
+        @pytest.fixture(scope="module")
+        def table():
+            return backend.load_table("users")
+
+        def test_first(table):
+            assert table == {"table": "users"}
+
+        def test_user():
+            assert backend.fetch_user(1) == {"id": 1}
+
+        def test_second(table):
+            assert backend.fetch_user(2) == {"id": 2}
+        """,
+    )
+    results = pytester.runpytest("--mimic-record", "--mimic-ledger")
+    assert results.parseoutcomes()["passed"] == 3
+    os.environ["MIMIC_RECORD"] = "0"
+
+    slice_path = pytester.path / "slice.tar.gz"
+    pytester.runpytest("--collect-only", "-k", "test_second", f"--mimic-export-slice={slice_path}")
+    with tarfile.open(slice_path) as archive:
+        names = archive.getnames()
+    # The table shared by the module fixture, the second user, their blobs and the metadata
+    assert len([name for name in names if name.endswith(".ref")]) == 2
+    assert len([name for name in names if name.startswith("blobs/")]) == 2
+    assert "mimic.json" in names
+
+    shutil.rmtree(pytester.path / ".mimic_vault")
+    results = pytester.runpytest("-k", "test_second", f"--mimic-import-slice={slice_path}")
+    assert results.parseoutcomes()["passed"] == 1
+
+    results = pytester.runpytest("-k", "test_user")
+    assert results.parseoutcomes()["failed"] == 1
+
+
+def test_slice_fixtures_with_the_same_name(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            backend.load_table
+    """)
+    pytester.makepyfile(
+        backend="""
+        def load_table(name):
+            return {"table": name}
+        """,
+        test_users="""
+        import pytest
+
+        import backend
+
+        @pytest.fixture(scope="module")
+        def table():
+            return backend.load_table("users")
+
+        def test_users(table):
+            assert table == {"table": "users"}
+        """,
+        test_orders="""
+        import pytest
+
+        import backend
+
+        @pytest.fixture(scope="module")
+        def table():
+            return backend.load_table("orders")
+
+        def test_orders(table):
+            assert table == {"table": "orders"}
+        """,
+    )
+    results = pytester.runpytest("--mimic-record", "--mimic-ledger")
+    assert results.parseoutcomes()["passed"] == 2
+    os.environ["MIMIC_RECORD"] = "0"
+
+    # Only the recording of the fixture of the selected module is exported
+    slice_path = pytester.path / "slice.tar.gz"
+    pytester.runpytest("--collect-only", "-k", "test_users", f"--mimic-export-slice={slice_path}")
+    with tarfile.open(slice_path) as archive:
+        names = archive.getnames()
+    assert len([name for name in names if name.endswith(".ref")]) == 1
+
+    shutil.rmtree(pytester.path / ".mimic_vault")
+    results = pytester.runpytest(f"--mimic-import-slice={slice_path}")
+    assert results.parseoutcomes() == {"passed": 1, "errors": 1}
+
+
+def test_slice_recordings_accessed_at_import(pytester):
+    pytester.makeini("""
+        [pytest]
+        asyncio_default_fixture_loop_scope = session
+        mimic_functions =
+            backend.load_table
+    """)
+    pytester.makepyfile(
+        backend="""
+        def load_table(name):
+            return {"table": name}
+        """,
+        test_import="""
+        import backend
+
+        SCHEMA = backend.load_table("schema")
+
+        def test_users():
+            assert backend.load_table("users") == {"table": "users"}
+
+        def test_orders():
+            assert SCHEMA == {"table": "schema"}
+        """,
+    )
+    # Pytester runs in this process, while this test is owning the recordings accessed
+    stop_test_usage()
+    results = pytester.runpytest("--mimic-record", "--mimic-ledger")
+    assert results.parseoutcomes()["passed"] == 2
+    os.environ["MIMIC_RECORD"] = "0"
+
+    # The recording accessed while importing the module is needed by any selection
+    slice_path = pytester.path / "slice.tar.gz"
+    pytester.runpytest("--collect-only", "-k", "test_orders", f"--mimic-export-slice={slice_path}")
+    with tarfile.open(slice_path) as archive:
+        names = archive.getnames()
+    assert len([name for name in names if name.endswith(".ref")]) == 1
+
+    shutil.rmtree(pytester.path / ".mimic_vault")
+    results = pytester.runpytest("-k", "test_orders", f"--mimic-import-slice={slice_path}")
+    assert results.parseoutcomes()["passed"] == 1
+
+
+def test_import_slice_outside_vault(tmp_path):
+    slice_path = tmp_path / "slice.tar"
+    with tarfile.open(slice_path, "w") as archive:
+        info = tarfile.TarInfo("../outside.ref")
+        info.size = 2
+        archive.addfile(info, io.BytesIO(b"{}"))
+
+    with pytest.raises(ValueError, match="Invalid file '../outside.ref'"):
+        import_vault_slice(slice_path)
+    assert not (tmp_path / "outside.ref").exists()